@@ -2,34 +2,20 @@
 Streamlit主应用
 """
 import streamlit as st
-import pandas as pd
-import numpy as np
-from datetime import datetime
-import io
 import sys
 import os
+import uuid
 
-# 添加utils目录到路径
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 添加utils目录到路径（每次rerun都会重新执行脚本，只在首次添加）
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+if _APP_DIR not in sys.path:
+    sys.path.append(_APP_DIR)
 
-from utils.data_processing import run_full_pipeline
-from utils.file_utils import (
-    read_uploaded_files,
-    validate_dataframes,
-    generate_excel_output,
-    generate_filename
-)
-
-# 页面配置
-st.set_page_config(
-    page_title="游戏关卡数据分析工具",
-    page_icon="🎮",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# pandas、plotly、pyarrow等较重的依赖在用到的步骤中才导入，缩短冷启动时间
+from utils.metrics import start_file_exporter
 
 # 自定义CSS样式
-st.markdown("""
+APP_CSS = """
 <style>
     .main-header {
         font-size: 2.5rem;
@@ -88,7 +74,58 @@ st.markdown("""
         border-radius: 5px;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# 步骤定义
+STEPS = [
+    ("上传文件", "上传原始数据和配置文件"),
+    ("数据验证", "检查数据格式和完整性"),
+    ("数据处理", "执行分析计算"),
+    ("下载结果", "获取分析结果文件")
+]
+
+# 后台解析进行中时刷新解析状态和预览的间隔（秒）
+INGEST_POLL_SECONDS = 1.0
+
+# 每个会话流水线阶段缓存的内存上限（字节）
+STAGE_CACHE_MAX_BYTES = 512 * 1024 ** 2
+
+
+@st.cache_resource(show_spinner=False)
+def step_indicator_html(current_step: int) -> str:
+    """步骤指示器HTML（进程内每个步骤只生成一次，跨rerun和会话共享）"""
+    step_html = '<div class="step-indicator">'
+    for i, (step, _) in enumerate(STEPS, 1):
+        if i == current_step:
+            step_html += f'<div class="step active">步骤{i}: {step}</div>'
+        elif i < current_step:
+            step_html += f'<div class="step completed">步骤{i}: {step}</div>'
+        else:
+            step_html += f'<div class="step">步骤{i}: {step}</div>'
+    step_html += '</div>'
+    return step_html
+
+
+def uploaded_file_key(uploaded_file) -> str:
+    """上传文件的唯一标识"""
+    file_id = getattr(uploaded_file, 'file_id', None)
+    return file_id or f"{uploaded_file.name}:{uploaded_file.size}"
+
+
+# 设置METRICS_FILE时定期写出Prometheus格式指标文件
+if os.environ.get('METRICS_FILE'):
+    start_file_exporter(os.environ['METRICS_FILE'])
+
+# 页面配置
+st.set_page_config(
+    page_title="游戏关卡数据分析工具",
+    page_icon="🎮",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# 自定义CSS样式（页面每次rerun都需要重新注入）
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
 # 初始化session state
 def init_session_state():
@@ -106,20 +143,29 @@ def init_session_state():
         st.session_state.dataframes = {
             'df_raw': None,
             'df_level_conf': None,
-            'df_level_group': None
+            'df_level_group': None,
+            'df_fuuu_rules': None
         }
     
+    # 后台解析任务: kind -> (文件标识, future)
+    if 'ingest_jobs' not in st.session_state:
+        st.session_state.ingest_jobs = {}
+    
     if 'validation' not in st.session_state:
         st.session_state.validation = None
     
     if 'processed_data' not in st.session_state:
         st.session_state.processed_data = None
     
-    if 'result_file' not in st.session_state:
-        st.session_state.result_file = None
+    if 'result_key' not in st.session_state:
+        st.session_state.result_key = None
     
     if 'processing_error' not in st.session_state:
         st.session_state.processing_error = None
+    
+    # 流水线阶段缓存，"开始新的分析"后保留，重新上传相同数据时只重跑变化的阶段
+    if 'stage_cache' not in st.session_state:
+        st.session_state.stage_cache = None
 
 # 渲染侧边栏
 def render_sidebar():
@@ -129,14 +175,8 @@ def render_sidebar():
         st.markdown("---")
         
         st.markdown("### 📋 使用步骤")
-        steps = [
-            ("1. 上传文件", "上传原始数据和配置文件"),
-            ("2. 数据验证", "检查数据格式和完整性"),
-            ("3. 数据处理", "执行分析计算"),
-            ("4. 下载结果", "获取分析结果文件")
-        ]
-        
-        for i, (step_title, step_desc) in enumerate(steps, 1):
+        for i, (step_name, step_desc) in enumerate(STEPS, 1):
+            step_title = f"{i}. {step_name}"
             if i == st.session_state.step:
                 st.markdown(f"**▶️ {step_title}**")
                 st.caption(step_desc)
@@ -160,6 +200,18 @@ def render_sidebar():
             help="用于确定evaluation的z-score阈值"
         )
         
+        st.session_state.engine = st.selectbox(
+            "计算引擎",
+            options=["pandas", "polars"],
+            help="polars为多线程列式引擎，适合大数据量（需安装polars）"
+        )
+        
+        st.session_state.save_history = st.checkbox(
+            "保存到历史记录",
+            value=True,
+            help="按event_id和ap_config_version分区保存处理结果，重复处理的event会被覆盖"
+        )
+        
         st.markdown("---")
         st.markdown("### ℹ️ 关于")
         st.markdown("""
@@ -170,6 +222,103 @@ def render_sidebar():
         **最后更新**: 2024-01-15
         """)
 
+# 上传文件后台解析
+def start_ingest(kind: str, uploaded_file):
+    """
+    文件上传后立即在独立进程中解析，替换文件时终止旧任务的进程；
+    无法启动子进程时在当前进程解析
+    """
+    from utils.ingest import submit_ingest, run_ingest_now
+    
+    jobs = st.session_state.ingest_jobs
+    file_key = uploaded_file_key(uploaded_file)
+    try:
+        submit_ingest(jobs, kind, file_key, uploaded_file)
+    except OSError:
+        run_ingest_now(jobs, kind, file_key, uploaded_file)
+
+
+def on_upload_change(kind: str):
+    """上传控件中的文件被移除时取消对应的后台解析"""
+    from utils.ingest import discard_ingest
+    
+    if st.session_state.get(f'{kind}_uploader') is None:
+        discard_ingest(st.session_state.ingest_jobs, kind)
+        st.session_state.uploaded_files[kind] = None
+
+
+def poll_while_ingesting(render, *args):
+    """
+    解析进行中时以fragment定期刷新render的内容，不阻塞页面其余部分；
+    run_every只在整页运行时确定，解析结束后整页重新运行一次以停止定时刷新
+    """
+    from utils.ingest import ingest_running
+    
+    if not ingest_running(st.session_state.ingest_jobs):
+        render(*args)
+        return
+    
+    @st.fragment(run_every=INGEST_POLL_SECONDS)
+    def poll():
+        render(*args)
+        if not ingest_running(st.session_state.ingest_jobs):
+            st.rerun(scope="app")
+    
+    poll()
+
+
+def render_ingest_status(kind: str):
+    """显示后台解析状态和首轮列检查结果"""
+    from utils.ingest import ingest_status, ingest_result
+    
+    status = ingest_status(st.session_state.ingest_jobs, kind)
+    if status == 'running':
+        st.caption("⏳ 后台解析中...")
+    elif status == 'failed':
+        try:
+            ingest_result(st.session_state.ingest_jobs, kind)
+        except Exception as e:
+            st.caption(f"❌ 解析失败: {str(e)}")
+    elif status == 'done':
+        from utils.file_utils import missing_columns
+        
+        result = ingest_result(st.session_state.ingest_jobs, kind)
+        if kind == 'raw':
+            frames, n_rows = {'df_raw': result}, len(result)
+        else:
+            frames, n_rows = {'df_level_conf': result[0], 'df_level_group': result[1]}, len(result[0])
+        missing = {frame: missing_columns(df, frame) for frame, df in frames.items()}
+        missing = {frame: cols for frame, cols in missing.items() if cols}
+        if missing:
+            st.caption(f"⚠️ 已解析，缺少列: {missing}")
+        else:
+            st.caption(f"✅ 已解析，共{n_rows}行，必需列齐全")
+
+
+def collect_ingest():
+    """
+    取得两个文件的解析结果；任务不存在、被取消或解析进程异常退出时在当前进程重新读取
+    """
+    from concurrent.futures import BrokenExecutor, CancelledError
+    from utils.file_utils import read_raw_file, read_conf_file
+    from utils.ingest import ingest_result
+    
+    def read_now(kind: str, read):
+        uploaded_file = st.session_state.uploaded_files[kind]
+        uploaded_file.seek(0)
+        result = read(uploaded_file)
+        uploaded_file.seek(0)
+        return result
+    
+    results = {}
+    for kind, read in (('raw', read_raw_file), ('conf', read_conf_file)):
+        try:
+            results[kind] = ingest_result(st.session_state.ingest_jobs, kind)
+        except (KeyError, CancelledError, BrokenExecutor):
+            results[kind] = read_now(kind, read)
+    return results['raw'], results['conf']
+
+
 # 步骤1: 文件上传
 def step_upload():
     """步骤1: 文件上传"""
@@ -196,12 +345,16 @@ def step_upload():
             "选择原始数据文件",
             type=['xlsx', 'xls'],
             key="raw_uploader",
+            on_change=on_upload_change,
+            args=('raw',),
             help="上传events_level_raw.xlsx类似的文件"
         )
         
         if uploaded_file_raw:
             st.session_state.uploaded_files['raw'] = uploaded_file_raw
+            start_ingest('raw', uploaded_file_raw)
             st.markdown(f'<div class="success-box">✅ 已上传: {uploaded_file_raw.name}</div>', unsafe_allow_html=True)
+            poll_while_ingesting(render_ingest_status, 'raw')
     
     with col2:
         st.subheader("2. 配置文件")
@@ -217,18 +370,27 @@ def step_upload():
         - ap_config_version
         - level_name_list
         - hidden_level_list
+        
+        **Sheet 3（可选）: fuuu_rules**
+        - event_id_start
+        - fuuu_list
+        - version（可选）
         """)
         
         uploaded_file_conf = st.file_uploader(
             "选择配置文件",
             type=['xlsx', 'xls'],
             key="conf_uploader",
+            on_change=on_upload_change,
+            args=('conf',),
             help="上传包含level_conf和level_group两个sheet的文件"
         )
         
         if uploaded_file_conf:
             st.session_state.uploaded_files['conf'] = uploaded_file_conf
+            start_ingest('conf', uploaded_file_conf)
             st.markdown(f'<div class="success-box">✅ 已上传: {uploaded_file_conf.name}</div>', unsafe_allow_html=True)
+            poll_while_ingesting(render_ingest_status, 'conf')
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -236,16 +398,18 @@ def step_upload():
     if all(st.session_state.uploaded_files.values()):
         if st.button("下一步：数据验证", type="primary", use_container_width=True):
             try:
-                # 读取文件
-                df_raw, df_level_conf, df_level_group = read_uploaded_files(
-                    st.session_state.uploaded_files['raw'],
-                    st.session_state.uploaded_files['conf']
-                )
+                from utils.file_utils import validate_dataframes
+                
+                # 读取后台解析结果（通常已完成）
+                with st.spinner("正在解析文件..."):
+                    df_raw, (df_level_conf, df_level_group, df_fuuu_rules) = collect_ingest()
                 
-                # 保存到session state
+                # 保存到session state，同时完成首轮验证
                 st.session_state.dataframes['df_raw'] = df_raw
                 st.session_state.dataframes['df_level_conf'] = df_level_conf
                 st.session_state.dataframes['df_level_group'] = df_level_group
+                st.session_state.dataframes['df_fuuu_rules'] = df_fuuu_rules
+                st.session_state.validation = validate_dataframes(df_raw, df_level_conf, df_level_group)
                 
                 # 转到下一步
                 st.session_state.step = 2
@@ -254,15 +418,25 @@ def step_upload():
             except Exception as e:
                 st.error(f"读取文件失败: {str(e)}")
     
-    # 显示示例数据预览
-    if st.session_state.uploaded_files['raw']:
-        with st.expander("📊 原始数据预览"):
-            try:
-                df_preview = pd.read_excel(st.session_state.uploaded_files['raw'], nrows=5)
-                st.dataframe(df_preview)
-                st.caption(f"显示前5行，共{len(pd.read_excel(st.session_state.uploaded_files['raw']))}行")
-            except:
-                pass
+    # 显示示例数据预览（使用后台解析结果，不重复解析，解析完成前不阻塞页面）
+    if st.session_state.uploaded_files['raw'] and 'raw' in st.session_state.ingest_jobs:
+        poll_while_ingesting(render_raw_preview)
+
+
+def render_raw_preview():
+    """原始数据预览（后台解析完成后显示）"""
+    from utils.ingest import ingest_ready, ingest_result
+    
+    with st.expander("📊 原始数据预览"):
+        if not ingest_ready(st.session_state.ingest_jobs, 'raw'):
+            st.caption("⏳ 后台解析完成后显示预览...")
+            return
+        try:
+            df_raw = ingest_result(st.session_state.ingest_jobs, 'raw')
+            st.dataframe(df_raw.head(5))
+            st.caption(f"显示前5行，共{len(df_raw)}行")
+        except:
+            pass
 
 # 步骤2: 数据验证
 def step_validation():
@@ -275,14 +449,17 @@ def step_validation():
         st.rerun()
         return
     
-    # 执行数据验证
-    validation_results = validate_dataframes(
-        st.session_state.dataframes['df_raw'],
-        st.session_state.dataframes['df_level_conf'],
-        st.session_state.dataframes['df_level_group']
-    )
+    # 执行数据验证（同一批数据只验证一次）
+    if st.session_state.validation is None:
+        from utils.file_utils import validate_dataframes
+        
+        st.session_state.validation = validate_dataframes(
+            st.session_state.dataframes['df_raw'],
+            st.session_state.dataframes['df_level_conf'],
+            st.session_state.dataframes['df_level_group']
+        )
     
-    st.session_state.validation = validation_results
+    validation_results = st.session_state.validation
     
     # 显示验证结果
     col1, col2, col3 = st.columns(3)
@@ -308,6 +485,18 @@ def step_validation():
             st.markdown('<div class="error-box">❌ level_group缺少列</div>', unsafe_allow_html=True)
             st.write(f"缺少列: {validation_results['missing_columns']['df_level_group']}")
     
+    # fuuu规则表
+    df_fuuu_rules = st.session_state.dataframes.get('df_fuuu_rules')
+    if df_fuuu_rules is not None:
+        from utils.data_processing import resolve_rule_table
+        
+        try:
+            rule_table = resolve_rule_table(df_fuuu_rules)
+            st.markdown(f'<div class="info-box">ℹ️ 使用配置中的fuuu规则表（版本 {rule_table.version}，'
+                        f'{len(rule_table.starts)}条曲线）</div>', unsafe_allow_html=True)
+        except ValueError as e:
+            st.markdown(f'<div class="error-box">❌ fuuu_rules无效: {str(e)}</div>', unsafe_allow_html=True)
+    
     # 显示数据概览
     st.markdown("### 📊 数据概览")
     
@@ -356,34 +545,51 @@ def step_processing():
     status_text = st.empty()
     
     try:
+        from utils.data_processing import run_full_pipeline
+        from utils.file_utils import release_excel_export
+        from utils.pipeline_cache import StageCache
+        
         status_text.text("🔄 开始数据处理...")
         progress_bar.progress(10)
         
+        if st.session_state.stage_cache is None:
+            st.session_state.stage_cache = StageCache(max_bytes=STAGE_CACHE_MAX_BYTES)
+        
         # 运行数据处理流水线
         df_processed, df_level_conf_processed, df_level_group_processed = run_full_pipeline(
             st.session_state.dataframes['df_raw'],
             st.session_state.dataframes['df_level_conf'],
-            st.session_state.dataframes['df_level_group']
+            st.session_state.dataframes['df_level_group'],
+            zscore_threshold=st.session_state.get('zscore_threshold', 1.0),
+            engine=st.session_state.get('engine', 'pandas'),
+            df_fuuu_rules=st.session_state.dataframes.get('df_fuuu_rules'),
+            cache=st.session_state.stage_cache
         )
         
-        progress_bar.progress(50)
-        status_text.text("💾 保存处理结果...")
-        
-        # 生成Excel文件
-        result_bytes = generate_excel_output(df_level_conf_processed, df_level_group_processed)
-        
         progress_bar.progress(80)
+        status_text.text("💾 保存处理结果...")
         
-        # 保存处理结果到session state
+        # 保存处理结果到session state（Excel文件在下载时才生成）
         st.session_state.processed_data = {
             'df_processed': df_processed,
             'df_level_conf_processed': df_level_conf_processed,
             'df_level_group_processed': df_level_group_processed
         }
         
-        st.session_state.result_file = result_bytes
+        if st.session_state.result_key:
+            release_excel_export(st.session_state.result_key)
+        st.session_state.result_key = uuid.uuid4().hex
         st.session_state.processing_error = None
         
+        # 写入历史记录
+        if st.session_state.get('save_history', True):
+            try:
+                from utils.history_store import append_results
+                
+                append_results(df_processed)
+            except Exception as e:
+                st.warning(f"保存历史记录失败: {str(e)}")
+        
         progress_bar.progress(100)
         status_text.text("✅ 处理完成！")
         
@@ -407,7 +613,7 @@ def step_download():
     """步骤4: 结果下载"""
     st.markdown('<h1 class="main-header">📥 下载结果</h1>', unsafe_allow_html=True)
     
-    if st.session_state.result_file is None:
+    if st.session_state.processed_data is None:
         st.warning("没有处理结果可下载。请返回上一步处理数据。")
         
         if st.button("返回处理步骤", type="primary"):
@@ -416,18 +622,81 @@ def step_download():
         
         return
     
-    # 生成文件名
-    filename = generate_filename()
-    
-    # 下载按钮
-    st.download_button(
-        label="📥 下载结果文件",
-        data=st.session_state.result_file,
-        file_name=filename,
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        use_container_width=True,
-        help="下载包含level_conf和level_group两个sheet的Excel文件"
-    )
+    from utils.file_utils import get_cached_export, get_excel_export, generate_filename
+    
+    # 首次请求下载时才生成Excel文件，之后复用
+    export_path = get_cached_export(st.session_state.result_key)
+    export_file = None
+    if export_path is not None:
+        try:
+            export_file = open(export_path, 'rb')
+        except FileNotFoundError:
+            # 导出缓存为所有会话共用，文件可能在查询后被其他会话的淘汰删除，需重新生成
+            export_file = None
+    
+    if export_file is None:
+        if st.button("📦 生成结果文件", type="primary", use_container_width=True,
+                     help="生成包含level_conf和level_group两个sheet的Excel文件"):
+            with st.spinner("正在生成Excel文件..."):
+                get_excel_export(
+                    st.session_state.result_key,
+                    st.session_state.processed_data['df_level_conf_processed'],
+                    st.session_state.processed_data['df_level_group_processed']
+                )
+            st.rerun()
+    else:
+        # 生成文件名
+        filename = generate_filename()
+        
+        # 下载按钮
+        with export_file:
+            st.download_button(
+                label="📥 下载结果文件",
+                data=export_file,
+                file_name=filename,
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True,
+                help="下载包含level_conf和level_group两个sheet的Excel文件"
+            )
+    
+    # 增量导出：只包含与上传的level_conf相比有变化的行和列
+    with st.expander("🔀 增量导出（仅变更部分）"):
+        delta = st.session_state.get('delta_export')
+        if delta is None or delta['result_key'] != st.session_state.result_key:
+            from utils.data_processing import build_level_conf_delta
+            from utils.file_utils import generate_delta_output
+            
+            df_patch, delta_summary = build_level_conf_delta(
+                st.session_state.dataframes['df_level_conf'],
+                st.session_state.processed_data['df_level_conf_processed']
+            )
+            delta = {
+                'result_key': st.session_state.result_key,
+                'patch': generate_delta_output(df_patch),
+                'summary': delta_summary
+            }
+            st.session_state.delta_export = delta
+        
+        delta_summary = delta['summary']
+        delta_col1, delta_col2, delta_col3 = st.columns(3)
+        with delta_col1:
+            st.metric("变更关卡", f"{delta_summary['changed_levels']}/{delta_summary['total_levels']}")
+        with delta_col2:
+            st.metric("新增关卡", delta_summary['new_levels'])
+        with delta_col3:
+            st.metric("变更比例", f"{delta_summary['changed_ratio']:.1%}")
+        st.write("**各列变更数:**", delta_summary['changed_cells'])
+        
+        if delta_summary['changed_levels']:
+            st.download_button(
+                label="📥 下载增量补丁",
+                data=delta['patch'],
+                file_name=generate_filename().replace('.xlsx', '_delta.csv'),
+                mime="text/csv",
+                use_container_width=True
+            )
+        else:
+            st.info("与上传的level_conf相比没有变化")
     
     # 显示处理结果统计
     st.markdown("### 📊 处理结果统计")
@@ -454,7 +723,7 @@ def step_download():
     
     # 结果预览
     with st.expander("🔍 结果预览"):
-        tab1, tab2, tab3 = st.tabs(["处理后数据", "level_conf", "数据统计"])
+        tab1, tab2, tab3, tab4 = st.tabs(["处理后数据", "level_conf", "数据统计", "诊断图表"])
         
         with tab1:
             if st.session_state.processed_data:
@@ -472,18 +741,118 @@ def step_download():
                 
                 # 显示统计信息
                 st.write("**数值列统计:**")
-                numeric_cols = df_processed.select_dtypes(include=[np.number]).columns
+                numeric_cols = df_processed.select_dtypes(include='number').columns
                 for col in numeric_cols[:5]:  # 显示前5个数值列
                     if col in ['churn_rate', 'actual_rev', 'z-score']:
                         st.write(f"{col}: 均值={df_processed[col].mean():.3f}, "
                                f"标准差={df_processed[col].std():.3f}")
+        
+        with tab4:
+            if st.session_state.processed_data:
+                from utils.charts import (
+                    build_zscore_distribution,
+                    build_rev_churn_scatter,
+                    build_evaluation_heatmap
+                )
+                
+                # 图表按结果缓存，其他控件交互导致的重新运行不再重建
+                threshold = st.session_state.get('zscore_threshold', 1.0)
+                charts = st.session_state.get('charts')
+                if charts is None or charts['key'] != (st.session_state.result_key, threshold):
+                    df_processed = st.session_state.processed_data['df_processed']
+                    charts = {
+                        'key': (st.session_state.result_key, threshold),
+                        'zscore': build_zscore_distribution(df_processed, threshold),
+                        'rev_churn': build_rev_churn_scatter(df_processed),
+                        'heatmap': build_evaluation_heatmap(df_processed)
+                    }
+                    st.session_state.charts = charts
+                
+                if charts['zscore'] is not None:
+                    st.plotly_chart(charts['zscore'], use_container_width=True)
+                else:
+                    st.info("没有可用的z-score数据")
+                st.plotly_chart(charts['rev_churn'], use_container_width=True)
+                
+                if charts['heatmap'] is not None:
+                    st.plotly_chart(charts['heatmap'], use_container_width=True)
+                else:
+                    st.info("没有可用的evaluation数据")
+    
+    # 阈值敏感性分析
+    with st.expander("🎚️ 阈值敏感性分析"):
+        if st.session_state.processed_data:
+            from utils.data_processing import resolve_rule_table
+            
+            # 与处理时使用同一张规则表，切换event_id替换其最后一条规则的起点
+            rule_table = resolve_rule_table(st.session_state.dataframes.get('df_fuuu_rules'))
+            st.caption("一次计算多个z-score阈值与fuuu表切换event_id组合下的evaluation数量"
+                       f"（fuuu规则表: {rule_table.version}）")
+            
+            sweep_col1, sweep_col2 = st.columns(2)
+            with sweep_col1:
+                thresholds_text = st.text_input("z-score阈值（逗号分隔）", value="0.8,1.0,1.2,1.5")
+            with sweep_col2:
+                if len(rule_table.starts) > 1:
+                    switch_text = st.text_input("最后一条fuuu规则的起始event_id（逗号分隔）",
+                                                value=f"{rule_table.starts[-1]:g}")
+                else:
+                    switch_text = ""
+                    st.caption("当前规则表只有一条曲线，只分析z-score阈值")
+            
+            if st.button("运行敏感性分析"):
+                try:
+                    from utils.data_processing import sweep_evaluation
+                    
+                    thresholds = [float(v) for v in thresholds_text.split(',') if v.strip()]
+                    switch_event_ids = [int(v) for v in switch_text.split(',') if v.strip()]
+                    
+                    level_counts, summary = sweep_evaluation(
+                        st.session_state.processed_data['df_processed'],
+                        thresholds,
+                        switch_event_ids,
+                        rule_table=rule_table
+                    )
+                    
+                    st.write("**各组合汇总:**")
+                    st.dataframe(summary, use_container_width=True)
+                    st.write("**各关卡evaluation行数:**")
+                    st.dataframe(level_counts, use_container_width=True)
+                    
+                except ValueError as e:
+                    st.error(f"参数格式错误: {str(e)}")
+    
+    # 历史趋势
+    with st.expander("📈 历史趋势"):
+        history_level_name = st.text_input("level_name", key="history_level_name")
+        
+        if history_level_name:
+            from utils.history_store import query_history
+            
+            df_history = query_history(level_names=[history_level_name.strip()])
+            
+            if df_history.empty:
+                st.info("没有该关卡的历史记录")
+            else:
+                st.line_chart(df_history.groupby('event_id')[['actual_rev', 'z-score']].mean())
+                st.dataframe(df_history, use_container_width=True)
     
     # 重新开始按钮
     st.markdown("---")
     if st.button("🔄 开始新的分析", type="secondary", use_container_width=True):
+        if st.session_state.result_key:
+            from utils.file_utils import release_excel_export
+            
+            release_excel_export(st.session_state.result_key)
+        
+        # 取消尚未完成的后台解析
+        from utils.ingest import discard_ingest
+        for kind in list(st.session_state.ingest_jobs):
+            discard_ingest(st.session_state.ingest_jobs, kind)
+        
         # 重置session state
-        for key in ['uploaded_files', 'dataframes', 'validation', 
-                   'processed_data', 'result_file', 'processing_error']:
+        for key in ['uploaded_files', 'dataframes', 'validation', 'ingest_jobs',
+                   'processed_data', 'result_key', 'processing_error', 'delta_export', 'charts']:
             if key in st.session_state:
                 del st.session_state[key]
         
@@ -497,17 +866,7 @@ def main():
     render_sidebar()
     
     # 显示步骤指示器
-    steps = ["上传文件", "数据验证", "数据处理", "下载结果"]
-    step_html = '<div class="step-indicator">'
-    for i, step in enumerate(steps, 1):
-        if i == st.session_state.step:
-            step_html += f'<div class="step active">步骤{i}: {step}</div>'
-        elif i < st.session_state.step:
-            step_html += f'<div class="step completed">步骤{i}: {step}</div>'
-        else:
-            step_html += f'<div class="step">步骤{i}: {step}</div>'
-    step_html += '</div>'
-    st.markdown(step_html, unsafe_allow_html=True)
+    st.markdown(step_indicator_html(st.session_state.step), unsafe_allow_html=True)
     
     # 根据当前步骤显示对应内容
     if st.session_state.step == 1:
@@ -0,0 +1,123 @@
+"""
+Streamlit应用冷启动与rerun延迟基准
+
+用法:
+    python benchmarks/bench_app.py --rows 20000 --reruns 20
+
+冷启动: 在全新解释器中导入streamlit并完成首次渲染的耗时（多次取中位数）。
+rerun: 使用streamlit.testing的AppTest，在每个步骤的session状态下重复运行脚本，报告中位数延迟。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+COLD_START_SCRIPT = f"""
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({APP_PATH!r}, default_timeout=120)
+at.run()
+assert not at.exception, at.exception
+print(time.perf_counter() - start)
+"""
+
+
+def measure_cold_start(samples: int) -> float:
+    """
+    全新进程中首次渲染的耗时中位数
+    """
+    timings = []
+    for _ in range(samples):
+        output = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT],
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def prepare_state(step: int, n_rows: int) -> dict:
+    """
+    构造进入指定步骤时的session state
+    """
+    from benchmarks.synthetic import make_synthetic_inputs
+    from utils.data_processing import run_full_pipeline
+
+    state = {'step': step}
+    if step == 1:
+        return state
+
+    df_raw, df_level_conf, df_level_group = make_synthetic_inputs(n_rows)
+    state['dataframes'] = {
+        'df_raw': df_raw,
+        'df_level_conf': df_level_conf,
+        'df_level_group': df_level_group
+    }
+    if step == 4:
+        df_processed, df_level_conf_processed, df_level_group_processed = run_full_pipeline(
+            df_raw, df_level_conf, df_level_group)
+        state['processed_data'] = {
+            'df_processed': df_processed,
+            'df_level_conf_processed': df_level_conf_processed,
+            'df_level_group_processed': df_level_group_processed
+        }
+        state['result_key'] = 'bench'
+    return state
+
+
+def measure_reruns(step: int, n_rows: int, reruns: int) -> float:
+    """
+    指定步骤下脚本rerun的中位数延迟
+    """
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=300)
+    for key, value in prepare_state(step, n_rows).items():
+        at.session_state[key] = value
+    at.run()
+
+    timings = []
+    for _ in range(reruns):
+        # 步骤3处理完成后会自动跳到步骤4，每次都重新回到步骤3
+        if step == 3:
+            at.session_state['step'] = 3
+        start = time.perf_counter()
+        at.run()
+        timings.append(time.perf_counter() - start)
+        assert not at.exception, at.exception
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--reruns', type=int, default=20)
+    parser.add_argument('--cold-samples', type=int, default=5)
+    parser.add_argument('--json', help='结果写入JSON文件')
+    args = parser.parse_args()
+
+    # 步骤3会写历史记录，基准运行时写到临时目录
+    os.environ.setdefault('LEVEL_HISTORY_DIR', tempfile.mkdtemp(prefix='bench_history_'))
+
+    results = {'cold_start_s': measure_cold_start(args.cold_samples), 'rerun_median_s': {}}
+    print(f"冷启动（首次渲染）: {results['cold_start_s'] * 1000:.0f} ms")
+
+    for step in (1, 2, 3, 4):
+        median = measure_reruns(step, args.rows, args.reruns)
+        results['rerun_median_s'][step] = median
+        print(f"步骤{step} rerun中位数: {median * 1000:.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
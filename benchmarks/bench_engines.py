@@ -0,0 +1,81 @@
+"""
+pandas与polars引擎的一致性检查和性能对比
+
+用法:
+    python benchmarks/bench_engines.py --rows 1000000 --threads 1 2 4 8
+
+每个线程数在独立子进程中运行（POLARS_MAX_THREADS需在导入polars前设置）。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from benchmarks.synthetic import make_synthetic_inputs
+from utils.data_processing import run_full_pipeline
+
+
+def check_parity(n_rows: int, seed: int = 0):
+    """
+    在合成数据上比较两个引擎的输出
+    """
+    inputs = make_synthetic_inputs(n_rows, seed=seed)
+    df_pd, conf_pd, _ = run_full_pipeline(*inputs, engine='pandas')
+    df_pl, conf_pl, _ = run_full_pipeline(*inputs, engine='polars')
+
+    pd.testing.assert_frame_equal(df_pd, df_pl, check_dtype=False, rtol=1e-9)
+    pd.testing.assert_frame_equal(conf_pd, conf_pl)
+    print(f"一致性检查通过: {n_rows}行, seed={seed}")
+
+
+def time_engines(n_rows: int, repeat: int) -> dict:
+    """
+    在当前进程中计时两个引擎
+    """
+    inputs = make_synthetic_inputs(n_rows)
+    timings = {}
+    for engine in ('pandas', 'polars'):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run_full_pipeline(*inputs, engine=engine)
+            best = min(best, time.perf_counter() - start)
+        timings[engine] = best
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(time_engines(args.rows, args.repeat)))
+        return
+
+    for n_rows, seed in [(10000, 0), (100000, 1), (100000, 2)]:
+        check_parity(n_rows, seed)
+
+    print(f"\n{'threads':>8} {'pandas(s)':>10} {'polars(s)':>10} {'speedup':>8}")
+    for threads in sorted(set(args.threads)):
+        env = dict(os.environ, POLARS_MAX_THREADS=str(threads))
+        output = subprocess.run(
+            [sys.executable, __file__, '--worker', '--rows', str(args.rows), '--repeat', str(args.repeat)],
+            env=env, capture_output=True, text=True, check=True
+        ).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        print(f"{threads:>8} {timings['pandas']:>10.3f} {timings['polars']:>10.3f} "
+              f"{timings['pandas'] / timings['polars']:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+共享内存多进程执行的一致性检查和扩展性测试
+
+用法:
+    python benchmarks/bench_parallel.py --rows 10000000 --workers 1 2 4 8 16 32
+
+n_workers=1为串行路径；其余进程数的输出必须与串行路径完全一致。
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from benchmarks.synthetic import make_synthetic_inputs
+from utils.data_processing import run_full_pipeline
+
+
+def check_parity(n_rows: int, n_workers: int, seed: int = 0):
+    """
+    在合成数据上比较多进程与串行路径的输出（逐值完全相等）
+    """
+    inputs = make_synthetic_inputs(n_rows, seed=seed)
+    df_serial, conf_serial, _ = run_full_pipeline(*inputs)
+    df_parallel, conf_parallel, _ = run_full_pipeline(*inputs, n_workers=n_workers)
+
+    pd.testing.assert_frame_equal(df_serial, df_parallel, check_exact=True)
+    pd.testing.assert_frame_equal(conf_serial, conf_parallel, check_exact=True)
+    print(f"一致性检查通过: {n_rows}行, {n_workers}进程, seed={seed}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10000000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    for n_rows, seed in [(10000, 0), (100000, 1)]:
+        check_parity(n_rows, max(args.workers), seed)
+
+    inputs = make_synthetic_inputs(args.rows)
+    # 进程池按进程数复用，先预热一次，计时不包含进程启动
+    for n_workers in sorted(set(args.workers)):
+        if n_workers > 1:
+            run_full_pipeline(*make_synthetic_inputs(10000), n_workers=n_workers)
+
+    print(f"\n{'workers':>8} {'time(s)':>9} {'speedup':>8}")
+    baseline = None
+    for n_workers in sorted(set(args.workers)):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            run_full_pipeline(*inputs, n_workers=n_workers)
+            best = min(best, time.perf_counter() - start)
+        baseline = baseline or best
+        print(f"{n_workers:>8} {best:>9.3f} {baseline / best:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""
+Streamlit应用多会话并发压测
+
+用法:
+    python benchmarks/load_app.py --rows 50000 --concurrency 1 2 4 8 --sessions 16 --json load_app.json
+
+每个会话在独立子进程中运行（AppTest会创建和销毁Streamlit的全局Runtime，不能在同一进程的
+多个线程中同时使用），同一并发级别最多同时运行concurrency个会话进程。每个会话执行完整的四步流程:
+    upload      通过file_uploader上传两个Excel（应用在后台解析进程中解析），
+                点击"下一步：数据验证"取得解析结果并完成首轮验证
+    validation  步骤2重新渲染（数据验证）
+    processing  点击"下一步：开始处理"，运行run_full_pipeline并渲染步骤4
+    export      点击"生成结果文件"，生成Excel并渲染下载按钮
+汇总各会话的步骤耗时，报告p50/p95/p99延迟、吞吐（会话/分钟）、峰值RSS和失败数。
+峰值RSS报告单个会话进程的最大值和所有会话进程树（含解析子进程和多进程计算的子进程）
+之和的峰值（Linux下按/proc定期采样）。会话进程之间不共享st.cache_resource等进程内缓存，
+进程树之和是多个独立服务进程的上限估计。AppTest操作file_uploader需要较新的streamlit。
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+STEP_NAMES = ('upload', 'validation', 'processing', 'export')
+
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def write_inputs(n_rows: int, input_dir: str):
+    """
+    生成合成数据并写成与实际上传一致的Excel文件
+    """
+    import pandas as pd
+    from benchmarks.synthetic import make_synthetic_inputs
+
+    df_raw, df_level_conf, df_level_group = make_synthetic_inputs(n_rows)
+    df_raw.to_excel(os.path.join(input_dir, 'raw.xlsx'), index=False)
+    with pd.ExcelWriter(os.path.join(input_dir, 'conf.xlsx'), engine='openpyxl') as writer:
+        df_level_conf.to_excel(writer, sheet_name='level_conf', index=False)
+        df_level_group.to_excel(writer, sheet_name='level_group', index=False)
+
+
+def click(at, label: str):
+    """
+    点击指定文字的按钮并运行
+    """
+    for button in at.button:
+        if button.label == label:
+            return button.click().run()
+    raise RuntimeError(f'找不到按钮: {label}')
+
+
+def run_session(raw_bytes: bytes, conf_bytes: bytes, timeout: float) -> dict:
+    """
+    执行一个会话的四步流程，返回各步骤耗时
+    """
+    from streamlit.testing.v1 import AppTest
+
+    timings = {}
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.run()
+
+    start = time.perf_counter()
+    at.file_uploader(key='raw_uploader').set_value(('raw.xlsx', raw_bytes, XLSX_MIME))
+    at.file_uploader(key='conf_uploader').set_value(('conf.xlsx', conf_bytes, XLSX_MIME))
+    at.run()
+    click(at, "下一步：数据验证")
+    timings['upload'] = time.perf_counter() - start
+    if at.session_state['step'] != 2:
+        raise RuntimeError(f"上传未完成: {[e.value for e in at.error]}")
+
+    start = time.perf_counter()
+    at.run()
+    timings['validation'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    click(at, "下一步：开始处理")
+    timings['processing'] = time.perf_counter() - start
+    if at.session_state['step'] != 4:
+        raise RuntimeError(f"处理未完成: {at.session_state['processing_error']}")
+
+    start = time.perf_counter()
+    click(at, "📦 生成结果文件")
+    timings['export'] = time.perf_counter() - start
+
+    if at.exception:
+        raise RuntimeError(str(at.exception))
+    return timings
+
+
+def peak_rss_mb() -> float:
+    """
+    当前进程的峰值RSS（MB）
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KB，macOS为字节
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _descendants(pid: int) -> list:
+    """
+    pid的全部子孙进程（不含pid自身，仅Linux）
+    """
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            for task in os.listdir(f'/proc/{current}/task'):
+                with open(f'/proc/{current}/task/{task}/children') as f:
+                    children = [int(child) for child in f.read().split()]
+                pids.extend(children)
+                pending.extend(children)
+        except OSError:
+            continue
+    return pids
+
+
+def descendants_rss_kb(pid: int) -> int:
+    """
+    pid全部子孙进程当前RSS之和（KB，仅Linux）
+    """
+    total = 0
+    for current in _descendants(pid):
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+    return total
+
+
+class TreeRssSampler:
+    """
+    后台线程定期采样本进程全部子孙进程的RSS之和，记录峰值
+    （解析子进程由forkserver创建、不由会话进程回收，RUSAGE_CHILDREN统计不到，因此按进程采样）
+    """
+
+    def __init__(self, interval: float = 0.2):
+        self.interval = interval
+        self.peak_kb = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while True:
+            self.peak_kb = max(self.peak_kb, descendants_rss_kb(os.getpid()))
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        if os.path.isdir('/proc/self/task'):
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+
+def session_main(input_dir: str, timeout: float):
+    """
+    会话子进程入口：执行一个会话，结果以JSON输出到stdout最后一行
+    """
+    with open(os.path.join(input_dir, 'raw.xlsx'), 'rb') as f:
+        raw_bytes = f.read()
+    with open(os.path.join(input_dir, 'conf.xlsx'), 'rb') as f:
+        conf_bytes = f.read()
+
+    timings = run_session(raw_bytes, conf_bytes, timeout)
+    print(json.dumps({'timings': timings, 'peak_rss_mb': peak_rss_mb()}))
+
+
+def run_level(input_dir: str, concurrency: int, sessions: int, timeout: float, env: dict) -> dict:
+    """
+    以指定并发执行一组会话，每个会话一个子进程
+    """
+    results, failures = [], []
+    lock = threading.Lock()
+
+    def session(_):
+        proc = subprocess.run(
+            [sys.executable, __file__, '--session', '--input-dir', input_dir, '--timeout', str(timeout)],
+            env=env, capture_output=True, text=True
+        )
+        with lock:
+            if proc.returncode == 0:
+                results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            else:
+                failures.append('\n'.join(proc.stderr.strip().splitlines()[-3:]))
+
+    start = time.perf_counter()
+    with TreeRssSampler() as sampler:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(session, range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'latencies': {step: [result['timings'][step] for result in results] for step in STEP_NAMES},
+        'failures': failures,
+        'elapsed_s': elapsed,
+        'peak_session_rss_mb': max((result['peak_rss_mb'] for result in results), default=0.0),
+        'peak_tree_rss_mb': sampler.peak_kb / 1024
+    }
+
+
+def summarize(concurrency: int, sessions: int, level: dict) -> dict:
+    import numpy as np
+
+    steps = {}
+    for step, latencies in level['latencies'].items():
+        if latencies:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            steps[step] = {'p50_s': float(p50), 'p95_s': float(p95), 'p99_s': float(p99)}
+    completed = len(level['latencies']['upload'])
+    return {
+        'concurrency': concurrency,
+        'sessions': sessions,
+        'completed': completed,
+        'failures': len(level['failures']),
+        'failure_samples': level['failures'][:3],
+        'elapsed_s': level['elapsed_s'],
+        'sessions_per_min': completed / level['elapsed_s'] * 60 if level['elapsed_s'] else 0.0,
+        'peak_session_rss_mb': level['peak_session_rss_mb'],
+        'peak_tree_rss_mb': level['peak_tree_rss_mb'],
+        'steps': steps
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--sessions', type=int, default=16, help='每个并发级别的会话数')
+    parser.add_argument('--timeout', type=float, default=600, help='单次脚本运行的超时（秒）')
+    parser.add_argument('--json', help='结果写入JSON文件')
+    parser.add_argument('--session', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--input-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.session:
+        session_main(args.input_dir, args.timeout)
+        return
+
+    input_dir = tempfile.mkdtemp(prefix='load_app_')
+    print(f"生成合成数据（{args.rows}行）...")
+    write_inputs(args.rows, input_dir)
+
+    # 步骤3会写历史记录，压测时写到临时目录
+    env = dict(os.environ)
+    env.setdefault('LEVEL_HISTORY_DIR', os.path.join(input_dir, 'history'))
+
+    report = {'rows': args.rows, 'levels': []}
+    print(f"\n{'concurrency':>11} {'done':>5} {'fail':>5} {'sess/min':>9} {'sess(MB)':>9} {'tree(MB)':>9} "
+          + ' '.join(f'{step + " p95(s)":>17}' for step in STEP_NAMES))
+    for concurrency in args.concurrency:
+        level = run_level(input_dir, concurrency, args.sessions, args.timeout, env)
+        summary = summarize(concurrency, args.sessions, level)
+        report['levels'].append(summary)
+
+        p95 = ' '.join(f"{summary['steps'].get(step, {}).get('p95_s', float('nan')):>17.2f}" for step in STEP_NAMES)
+        print(f"{concurrency:>11} {summary['completed']:>5} {summary['failures']:>5} "
+              f"{summary['sessions_per_min']:>9.1f} {summary['peak_session_rss_mb']:>9.0f} "
+              f"{summary['peak_tree_rss_mb']:>9.0f} {p95}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+任务服务压测：不同并发下的持续吞吐（jobs/min）与p95延迟
+
+用法:
+    python benchmarks/load_service.py --rows 50000 --concurrency 1 2 4 8 --jobs 24 --workers 4
+
+在本进程内启动service，每个客户端线程循环执行 提交 → 轮询 → 下载结果。
+每个任务使用不同seed的合成数据，避免命中去重。
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from benchmarks.synthetic import make_synthetic_inputs
+from service import create_server
+
+
+def to_parquet_bytes(df) -> bytes:
+    output = io.BytesIO()
+    df.to_parquet(output, index=False)
+    return output.getvalue()
+
+
+def encode_multipart(files: dict, fields: dict):
+    """
+    编码multipart/form-data请求体
+    """
+    boundary = uuid.uuid4().hex
+    chunks = []
+    for name, value in fields.items():
+        chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        chunks.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                      f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        chunks.append(data)
+        chunks.append(b'\r\n')
+    chunks.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(chunks), f'multipart/form-data; boundary={boundary}'
+
+
+def run_job(base_url: str, files: dict, poll_interval: float) -> float:
+    """
+    提交任务并等待结果，返回端到端延迟（秒）
+    """
+    start = time.perf_counter()
+    body, content_type = encode_multipart(files, {'engine': 'pandas'})
+    request = urllib.request.Request(f'{base_url}/jobs', data=body, headers={'Content-Type': content_type})
+    with urllib.request.urlopen(request) as response:
+        job_id = json.loads(response.read())['job_id']
+
+    while True:
+        with urllib.request.urlopen(f'{base_url}/jobs/{job_id}') as response:
+            status = json.loads(response.read())['status']
+        if status == 'done':
+            break
+        if status == 'failed':
+            raise RuntimeError(f'任务失败: {job_id}')
+        time.sleep(poll_interval)
+
+    with urllib.request.urlopen(f'{base_url}/jobs/{job_id}/result?format=parquet') as response:
+        response.read()
+
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--jobs', type=int, default=24, help='每个并发级别的任务数')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--poll-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    # 预先生成不同seed的输入，避免计时包含数据生成
+    print("生成合成数据...")
+    inputs = []
+    for seed in range(args.jobs * len(args.concurrency)):
+        df_raw, df_level_conf, df_level_group = make_synthetic_inputs(args.rows, seed=seed)
+        inputs.append({
+            'raw': ('raw.parquet', to_parquet_bytes(df_raw)),
+            'level_conf': ('level_conf.parquet', to_parquet_bytes(df_level_conf)),
+            'level_group': ('level_group.parquet', to_parquet_bytes(df_level_group))
+        })
+
+    server = create_server('127.0.0.1', 0, workers=args.workers, max_pending=max(args.concurrency) * 2)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f'http://127.0.0.1:{server.server_address[1]}'
+
+    print(f"\n{'concurrency':>11} {'jobs':>5} {'jobs/min':>9} {'p50(s)':>8} {'p95(s)':>8}")
+    try:
+        for level, concurrency in enumerate(args.concurrency):
+            batch = inputs[level * args.jobs:(level + 1) * args.jobs]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                latencies = list(pool.map(lambda files: run_job(base_url, files, args.poll_interval), batch))
+            elapsed = time.perf_counter() - start
+
+            print(f"{concurrency:>11} {len(latencies):>5} {len(latencies) / elapsed * 60:>9.1f} "
+                  f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 95):>8.2f}")
+    finally:
+        server.shutdown()
+        server.RequestHandlerClass.manager.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+合成测试数据生成
+"""
+import pandas as pd
+import numpy as np
+from typing import Tuple
+
+LEVELS_PER_EVENT = 120
+ATTRIBUTE_KEYS = [101, 102, 103, 104, 4, 5, 1, 15, 17, 9, 7, 10, 11, 12, 13, 14, 16, 18, 19]
+
+
+def make_synthetic_inputs(n_rows: int = 100000,
+                          n_level_names: int = 3000,
+                          seed: int = 0) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    生成(df_raw, df_level_conf, df_level_group)，结构与上传文件一致
+
+    每个(event_id, ap_config_version)组合包含120个lv_id，
+    event_id从40开始递增，覆盖新旧两张fuuu表。
+    """
+    rng = np.random.default_rng(seed)
+    n_groups = max(1, -(-n_rows // LEVELS_PER_EVENT))
+
+    group_event_ids = 40 + np.arange(n_groups) // 2
+    group_ap_versions = np.array([f'1.{i % 2}' for i in range(n_groups)])
+    level_names = np.array([f'level_{i:05d}' for i in range(n_level_names)])
+
+    # 原始数据
+    df_raw = pd.DataFrame({
+        'event_id': np.repeat(group_event_ids, LEVELS_PER_EVENT)[:n_rows],
+        'ap_config_version': np.repeat(group_ap_versions, LEVELS_PER_EVENT)[:n_rows],
+        'lv_id': np.tile(np.arange(1, LEVELS_PER_EVENT + 1), n_groups)[:n_rows],
+        'total_churn_rate': rng.uniform(0, 0.2, n_rows),
+        'in_level_churn_rate': rng.uniform(0, 0.2, n_rows),
+        'avg_start_times': rng.gamma(2.0, 2.0, n_rows),
+        'rv_efficiency': rng.uniform(0, 1, n_rows)
+    })
+    df_raw.loc[rng.random(n_rows) < 0.3, 'total_churn_rate'] = np.nan
+
+    # level_group：每组60个主关卡和60个隐藏关卡
+    picks = rng.integers(0, n_level_names, size=(n_groups, LEVELS_PER_EVENT))
+    df_level_group = pd.DataFrame({
+        'event_id': group_event_ids,
+        'ap_config_version': group_ap_versions,
+        'level_name_list': [','.join(level_names[row[:60]]) for row in picks],
+        'hidden_level_list': [','.join(level_names[row[60:]]) for row in picks]
+    })
+
+    # level_conf
+    targets = []
+    for _ in range(n_level_names):
+        keys = rng.choice(ATTRIBUTE_KEYS, size=rng.integers(1, 4), replace=False)
+        targets.append(';'.join(f'{key},{rng.integers(10, 60)}' for key in keys))
+
+    df_level_conf = pd.DataFrame({
+        'level_name': level_names,
+        'target_num': rng.integers(1, 4, n_level_names),
+        'target': targets
+    })
+
+    return df_raw, df_level_conf, df_level_group
@@ -0,0 +1,382 @@
+"""
+无界面HTTP任务服务
+
+提交原始数据与配置文件后在有界线程池中异步运行validate_dataframes和
+run_full_pipeline，通过任务ID轮询进度并下载结果。相同输入按哈希去重。
+
+启动:
+    python service.py --host 127.0.0.1 --port 8600 --workers 4
+
+接口:
+    POST /jobs                    multipart/form-data
+                                  raw: 原始数据（xlsx/xls/parquet/csv）
+                                  conf: 配置文件（含level_conf和level_group两个sheet的xlsx）
+                                  或 level_conf + level_group: 两个独立的表格文件
+                                  可选 fuuu_rules: fuuu规则表（conf中也可包含fuuu_rules sheet）
+                                  可选字段: zscore_threshold, engine
+    GET  /jobs/<job_id>           任务状态与阶段进度
+    GET  /jobs/<job_id>/result    结果文件 ?format=xlsx|parquet&table=level_conf|level_group
+    GET  /health
+    GET  /metrics                 Prometheus文本格式指标
+"""
+import argparse
+import hashlib
+import io
+import json
+import sys
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+# 添加utils目录到路径
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from utils.data_processing import run_full_pipeline, ZSCORE_THRESHOLD, ENGINES
+from utils.file_utils import (
+    read_table,
+    read_conf_file,
+    validate_dataframes,
+    generate_excel_output,
+    generate_parquet_output,
+    generate_filename
+)
+from utils.metrics import REGISTRY, PARSE_SECONDS, PARSE_BYTES, byte_size_bucket, record_cache
+
+# 保留的任务数上限（超出时淘汰最早完成的任务）
+MAX_RETAINED_JOBS = 256
+
+XLSX_MIME = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class JobManager:
+    """
+    任务队列：有界线程池执行，按输入哈希去重
+    """
+
+    def __init__(self, workers: int = 4, max_pending: int = 64):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pipeline')
+        self.max_pending = max_pending
+        self.jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, files: Dict[str, Tuple[str, bytes]], params: Dict) -> Tuple[Dict, bool]:
+        """
+        提交任务，返回(任务状态, 是否命中已有任务)
+        """
+        self._check_request(files, params)
+        job_id = self._input_hash(files, params)
+
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is not None and job['status'] != 'failed':
+                record_cache('job', True)
+                return self._public(job), True
+            record_cache('job', False)
+
+            pending = sum(1 for j in self.jobs.values() if j['status'] in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise OverflowError("任务队列已满，请稍后重试")
+
+            job = {
+                'job_id': job_id,
+                'status': 'queued',
+                'stage': None,
+                'progress': 0.0,
+                'error': None,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'rows': None,
+                'result': None,
+                'exports': {},
+                'lock': threading.Lock()
+            }
+            self.jobs[job_id] = job
+            self._evict()
+
+        self.executor.submit(self._run, job, files, params)
+        return self._public(job), False
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return self._public(job) if job is not None else None
+
+    def get_export(self, job_id: str, fmt: str, table: str) -> Optional[bytes]:
+        """
+        获取结果文件，首次请求时生成并缓存
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None or job['status'] != 'done':
+            return None
+
+        key = (fmt, table if fmt == 'parquet' else None)
+        # 同一任务的并发下载只生成一次
+        with job['lock']:
+            export = job['exports'].get(key)
+            if export is None:
+                df_level_conf, df_level_group = job['result']
+                if fmt == 'xlsx':
+                    export = generate_excel_output(df_level_conf, df_level_group)
+                else:
+                    export = generate_parquet_output(df_level_conf if table == 'level_conf' else df_level_group)
+                job['exports'][key] = export
+        return export
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job: Dict, files: Dict[str, Tuple[str, bytes]], params: Dict):
+        job['status'] = 'running'
+        job['started_at'] = time.time()
+
+        def on_progress(stage: str, fraction: float):
+            job['stage'] = stage
+            job['progress'] = round(0.1 + 0.9 * fraction, 4)
+
+        try:
+            job['stage'] = 'read_files'
+            df_raw, df_level_conf, df_level_group, df_fuuu_rules = self._read_inputs(files)
+            job['rows'] = len(df_raw)
+
+            job['stage'] = 'validate_dataframes'
+            job['progress'] = 0.05
+            validation = validate_dataframes(df_raw, df_level_conf, df_level_group)
+            missing = {name: cols for name, cols in validation['missing_columns'].items() if cols}
+            if missing:
+                raise ValueError(f"缺少必需列: {missing}")
+
+            _, df_level_conf_processed, df_level_group_processed = run_full_pipeline(
+                df_raw, df_level_conf, df_level_group,
+                zscore_threshold=params['zscore_threshold'],
+                engine=params['engine'],
+                progress_callback=on_progress,
+                df_fuuu_rules=df_fuuu_rules
+            )
+
+            job['result'] = (df_level_conf_processed, df_level_group_processed)
+            job['status'] = 'done'
+        except Exception as e:
+            job['error'] = str(e)
+            job['status'] = 'failed'
+        finally:
+            job['finished_at'] = time.time()
+
+    @staticmethod
+    def _check_request(files: Dict[str, Tuple[str, bytes]], params: Dict):
+        """
+        提交前检查必需的文件字段和参数，不合法时抛出ValueError（返回400）
+        """
+        if 'raw' not in files:
+            raise ValueError("缺少raw文件")
+        if 'conf' not in files and not ('level_conf' in files and 'level_group' in files):
+            raise ValueError("缺少conf文件（或level_conf和level_group文件）")
+        if params['engine'] not in ENGINES:
+            raise ValueError(f"未知的计算引擎: {params['engine']}，可选: {', '.join(ENGINES)}")
+
+    @staticmethod
+    def _read_inputs(files: Dict[str, Tuple[str, bytes]]):
+        if 'raw' not in files:
+            raise ValueError("缺少raw文件")
+
+        filename, data = files['raw']
+        df_raw = read_table(data, filename)
+
+        df_fuuu_rules = None
+        if 'conf' in files:
+            filename, data = files['conf']
+            if filename.lower().endswith(('.xlsx', '.xls')):
+                # 工作簿只打开一次，同时读取level_conf、level_group和fuuu_rules
+                with PARSE_SECONDS.time(size_bucket=byte_size_bucket(len(data))):
+                    df_level_conf, df_level_group, df_fuuu_rules = read_conf_file(io.BytesIO(data))
+                PARSE_BYTES.inc(len(data))
+            else:
+                df_level_conf = read_table(data, filename, sheet_name='level_conf')
+                df_level_group = read_table(data, filename, sheet_name='level_group')
+        elif 'level_conf' in files and 'level_group' in files:
+            df_level_conf = read_table(files['level_conf'][1], files['level_conf'][0])
+            df_level_group = read_table(files['level_group'][1], files['level_group'][0])
+        else:
+            raise ValueError("缺少conf文件（或level_conf和level_group文件）")
+
+        if 'fuuu_rules' in files:
+            df_fuuu_rules = read_table(files['fuuu_rules'][1], files['fuuu_rules'][0])
+
+        return df_raw, df_level_conf, df_level_group, df_fuuu_rules
+
+    @staticmethod
+    def _input_hash(files: Dict[str, Tuple[str, bytes]], params: Dict) -> str:
+        digest = hashlib.sha256()
+        for name in sorted(files):
+            filename, data = files[name]
+            digest.update(name.encode())
+            digest.update(os.path.splitext(filename.lower())[1].encode())
+            digest.update(hashlib.sha256(data).digest())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()[:32]
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'failed')]
+        while len(self.jobs) > MAX_RETAINED_JOBS and finished:
+            del self.jobs[finished.pop(0)]
+
+    @staticmethod
+    def _public(job: Dict) -> Dict:
+        return {key: value for key, value in job.items() if key not in ('result', 'exports', 'lock')}
+
+
+def parse_multipart(content_type: str, body: bytes) -> Tuple[Dict[str, Tuple[str, bytes]], Dict[str, str]]:
+    """
+    解析multipart/form-data，返回(文件字段, 普通字段)
+    """
+    message = BytesParser(policy=HTTP).parsebytes(
+        f'Content-Type: {content_type}\r\n\r\n'.encode() + body
+    )
+    if not message.is_multipart():
+        raise ValueError("请求必须为multipart/form-data")
+
+    files, fields = {}, {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        if not name:
+            continue
+        payload = part.get_payload(decode=True) or b''
+        filename = part.get_filename()
+        if filename:
+            files[name] = (filename, payload)
+        else:
+            fields[name] = payload.decode('utf-8')
+    return files, fields
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP请求处理
+    """
+    manager: JobManager = None
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/jobs':
+            return self._send_json(404, {'error': '未找到'})
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            files, fields = parse_multipart(self.headers.get('Content-Type', ''), self.rfile.read(length))
+            params = {
+                'zscore_threshold': float(fields.get('zscore_threshold', ZSCORE_THRESHOLD)),
+                'engine': fields.get('engine', 'pandas')
+            }
+            job, deduplicated = self.manager.submit(files, params)
+        except OverflowError as e:
+            return self._send_json(503, {'error': str(e)})
+        except ValueError as e:
+            return self._send_json(400, {'error': str(e)})
+
+        job['deduplicated'] = deduplicated
+        self._send_json(200 if deduplicated else 202, job)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split('/') if p]
+
+        if parts == ['health']:
+            return self._send_json(200, {'status': 'ok'})
+
+        if parts == ['metrics']:
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = self.manager.get(parts[1])
+            if job is None:
+                return self._send_json(404, {'error': '任务不存在'})
+            return self._send_json(200, job)
+
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'result':
+            query = parse_qs(url.query)
+            fmt = query.get('format', ['xlsx'])[0]
+            table = query.get('table', ['level_conf'])[0]
+            if fmt not in ('xlsx', 'parquet') or table not in ('level_conf', 'level_group'):
+                return self._send_json(400, {'error': '不支持的format或table'})
+
+            job = self.manager.get(parts[1])
+            if job is None:
+                return self._send_json(404, {'error': '任务不存在'})
+            if job['status'] != 'done':
+                return self._send_json(409, {'error': f"任务状态为{job['status']}", 'job': job})
+
+            data = self.manager.get_export(parts[1], fmt, table)
+            if data is None:
+                # 任务在查询状态后被淘汰
+                return self._send_json(404, {'error': '任务不存在'})
+            if fmt == 'xlsx':
+                filename, mime = generate_filename(), XLSX_MIME
+            else:
+                filename, mime = f'{table}.parquet', 'application/octet-stream'
+            return self._send_bytes(data, mime, filename)
+
+        self._send_json(404, {'error': '未找到'})
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_bytes(self, data: bytes, mime: str, filename: str):
+        self.send_response(200)
+        self.send_header('Content-Type', mime)
+        self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def create_server(host: str = '127.0.0.1', port: int = 8600,
+                  workers: int = 4, max_pending: int = 64) -> ThreadingHTTPServer:
+    """
+    创建HTTP服务（调用serve_forever启动）
+    """
+    handler = type('Handler', (JobRequestHandler,), {'manager': JobManager(workers, max_pending)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关卡数据分析任务服务")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-pending', type=int, default=64)
+    args = parser.parse_args()
+
+    server = create_server(args.host, args.port, args.workers, args.max_pending)
+    print(f"任务服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.RequestHandlerClass.manager.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
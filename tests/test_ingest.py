@@ -0,0 +1,91 @@
+"""
+上传文件后台解析任务的测试
+"""
+import io
+import os
+import signal
+import time
+from concurrent.futures import BrokenExecutor
+
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import make_synthetic_inputs
+from utils.ingest import discard_ingest, ingest_result, ingest_status, submit_ingest
+
+
+def xlsx_upload(df: pd.DataFrame) -> io.BytesIO:
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return io.BytesIO(buffer.getvalue())
+
+
+def wait_for(condition, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.05)
+
+
+@pytest.fixture(scope='module')
+def raw_upload():
+    return xlsx_upload(make_synthetic_inputs(600)[0])
+
+
+@pytest.fixture(scope='module')
+def large_upload():
+    return xlsx_upload(make_synthetic_inputs(60000)[0])
+
+
+def test_parse_result(raw_upload):
+    jobs = {}
+    submit_ingest(jobs, 'raw', 'a', raw_upload)
+    df_raw = ingest_result(jobs, 'raw', timeout=60)
+
+    pd.testing.assert_frame_equal(df_raw, pd.read_excel(io.BytesIO(raw_upload.getvalue())))
+    assert ingest_status(jobs, 'raw') == 'done'
+
+
+def test_same_file_is_not_resubmitted(raw_upload):
+    jobs = {}
+    first = submit_ingest(jobs, 'raw', 'a', raw_upload)
+    assert submit_ingest(jobs, 'raw', 'a', raw_upload) is first
+    first.result(timeout=60)
+
+
+def test_replace_terminates_running_parse(large_upload, raw_upload):
+    jobs = {}
+    old = submit_ingest(jobs, 'raw', 'large', large_upload)
+    process = old._process
+    assert ingest_status(jobs, 'raw') == 'running'
+
+    submit_ingest(jobs, 'raw', 'small', raw_upload)
+    assert old.cancelled()
+    process.join(timeout=5)
+    assert not process.is_alive()
+    assert len(ingest_result(jobs, 'raw', timeout=60)) == 600
+
+
+def test_discard_terminates_running_parse(large_upload):
+    jobs = {}
+    future = submit_ingest(jobs, 'raw', 'large', large_upload)
+    discard_ingest(jobs, 'raw')
+
+    assert 'raw' not in jobs and future.cancelled()
+    future._process.join(timeout=5)
+    assert not future._process.is_alive()
+
+
+def test_killed_parse_is_resubmitted(large_upload):
+    jobs = {}
+    future = submit_ingest(jobs, 'raw', 'large', large_upload)
+    wait_for(lambda: future._process.pid is not None)
+    os.kill(future._process.pid, signal.SIGKILL)
+
+    with pytest.raises(BrokenExecutor):
+        future.result(timeout=30)
+    assert ingest_status(jobs, 'raw') == 'failed'
+
+    retry = submit_ingest(jobs, 'raw', 'large', large_upload)
+    assert retry is not future
+    retry.cancel()
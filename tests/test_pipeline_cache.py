@@ -0,0 +1,100 @@
+"""
+流水线阶段缓存的部分重算测试
+
+修改输入后只应重跑受影响的阶段，结果与不使用缓存时一致。
+"""
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import make_synthetic_inputs
+from utils.data_processing import run_full_pipeline
+from utils.pipeline_cache import StageCache
+
+MAIN_STAGES = ['add_level_name', 'add_churn_rate', 'calculate_rev', 'add_actual_rev']
+CONF_STAGES = ['process_evaluation_conf', 'process_rec_difficulty', 'adjust_column_order']
+
+
+def run_recorded(inputs, cache, **kwargs):
+    """
+    运行流水线，返回(结果, 实际执行的阶段)
+    """
+    executed = []
+
+    def record(stage, _):
+        if stage != 'done':
+            executed.append(stage)
+
+    result = run_full_pipeline(*inputs, cache=cache, progress_callback=record, **kwargs)
+    return result, executed
+
+
+def assert_same_result(result, inputs, **kwargs):
+    df, df_level_conf, _ = result
+    df_expected, conf_expected, _ = run_full_pipeline(*inputs, **kwargs)
+    pd.testing.assert_frame_equal(df, df_expected, check_exact=True)
+    pd.testing.assert_frame_equal(df_level_conf, conf_expected, check_exact=True)
+
+
+@pytest.fixture
+def inputs():
+    return make_synthetic_inputs(6000, n_level_names=300, seed=0)
+
+
+def edit_level_conf(inputs):
+    df_raw, df_level_conf, df_level_group = inputs
+    df_level_conf = df_level_conf.copy()
+    df_level_conf.loc[df_level_conf.index[:10], 'target'] = '101,20;4,30'
+    return df_raw, df_level_conf, df_level_group
+
+
+def edit_level_group(inputs):
+    df_raw, df_level_conf, df_level_group = inputs
+    df_level_group = df_level_group.copy()
+    names = df_level_group.loc[0, 'level_name_list'].split(',')
+    df_level_group.loc[0, 'level_name_list'] = ','.join(reversed(names))
+    return df_raw, df_level_conf, df_level_group
+
+
+def test_level_conf_edit_reruns_only_conf_stages(inputs):
+    cache = StageCache()
+    _, executed = run_recorded(inputs, cache)
+    assert executed[:len(MAIN_STAGES)] == MAIN_STAGES
+
+    edited = edit_level_conf(inputs)
+    result, executed = run_recorded(edited, cache)
+    assert executed == ['process_attribute'] + CONF_STAGES
+    assert_same_result(result, edited)
+
+
+def test_level_group_edit_keeps_attribute(inputs):
+    cache = StageCache()
+    run_recorded(inputs, cache)
+
+    edited = edit_level_group(inputs)
+    result, executed = run_recorded(edited, cache)
+    assert executed == MAIN_STAGES + ['add_zscore', 'add_fuuu', 'add_evaluation'] + CONF_STAGES
+    assert_same_result(result, edited)
+
+
+def test_threshold_change_reruns_evaluation_only(inputs):
+    cache = StageCache()
+    run_recorded(inputs, cache)
+
+    result, executed = run_recorded(inputs, cache, zscore_threshold=1.5)
+    assert executed == ['add_evaluation'] + CONF_STAGES
+    assert_same_result(result, inputs, zscore_threshold=1.5)
+
+
+def test_parallel_threshold_change_reuses_actual_rev(inputs):
+    cache = StageCache()
+    run_recorded(inputs, cache, n_workers=2)
+
+    result, executed = run_recorded(inputs, cache, n_workers=2, zscore_threshold=1.5)
+    assert executed == ['parallel_level_stages'] + CONF_STAGES
+    assert_same_result(result, inputs, zscore_threshold=1.5)
+
+
+def test_only_reusable_stages_are_cached(inputs):
+    cache = StageCache()
+    run_recorded(inputs, cache)
+    assert len(cache) == 4
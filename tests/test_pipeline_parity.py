@@ -0,0 +1,303 @@
+"""
+run_full_pipeline各执行路径的一致性测试
+
+pandas串行、polars引擎、n_workers=2多进程路径与逐行实现（基线版本的原始逻辑）
+在小规模合成数据及边界情况上的输出必须一致。
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import make_synthetic_inputs
+from utils.data_processing import (
+    FUUU_EVA, FUUU_NEW, FUUU_OLD, FUUU_SWITCH_EVENT_ID, ZSCORE_THRESHOLD,
+    add_actual_rev, add_churn_rate, adjust_column_order, calculate_rev,
+    create_lookup_dict, process_attribute, run_batch_pipeline, run_full_pipeline
+)
+
+BUILTIN_RULES = [(-np.inf, FUUU_OLD), (FUUU_SWITCH_EVENT_ID, FUUU_NEW)]
+
+
+# 逐行实现（基线版本的原始逻辑，规则表参数化）
+
+def baseline_level_name(df, df_level_group):
+    df = df.copy()
+    df['lv_id'] = df['lv_id'].astype(int)
+    lookup_dict = create_lookup_dict(df_level_group)
+
+    def lookup(row):
+        key = (str(row['event_id']), str(row['ap_config_version']))
+        return lookup_dict.get(key, {}).get(int(row['lv_id']))
+
+    df['level_name'] = df.apply(lookup, axis=1)
+    return df
+
+
+def baseline_zscore(df):
+    filtered_df = df[df['event_id'] >= 60]
+    group_stats = filtered_df.groupby('lv_id')['actual_rev'].agg(['mean', 'std']).reset_index()
+    group_stats.columns = ['lv_id', 'mean_actual_rev', 'std_actual_rev']
+    df = pd.merge(df, group_stats, on='lv_id', how='left')
+
+    def zscore(row):
+        if row['std_actual_rev'] == 0:
+            return 0.0
+        return (row['actual_rev'] - row['mean_actual_rev']) / row['std_actual_rev']
+
+    df['z-score'] = df.apply(zscore, axis=1).astype(float) if len(df) else np.nan
+    return df.drop(['mean_actual_rev', 'std_actual_rev'], axis=1)
+
+
+def baseline_fuuu(df, rules):
+    def fuuu(row):
+        lv_id = int(row['lv_id'])
+        # event_id为空时使用最后一条规则
+        curve = rules[-1][1]
+        for (start, current), (next_start, _) in zip(rules, rules[1:]):
+            if start <= row['event_id'] < next_start:
+                curve = current
+                break
+        else:
+            if row['event_id'] < rules[0][0]:
+                return None
+        if 0 <= lv_id - 1 < len(curve):
+            return curve[lv_id - 1]
+        return None
+
+    df = df.copy()
+    df['fuuu'] = df.apply(fuuu, axis=1)
+    return df
+
+
+def baseline_evaluation(df, zscore_threshold):
+    def evaluation(row):
+        if row['event_id'] < 60:
+            return None
+        if pd.isna(row['z-score']) or pd.isna(row['fuuu']):
+            return None
+        eva = FUUU_EVA.get(int(row['fuuu']))
+        if eva is None:
+            return None
+        if row['z-score'] > zscore_threshold:
+            return eva
+        if row['z-score'] < -zscore_threshold:
+            return -eva
+        return None
+
+    df = df.copy()
+    df['evaluation'] = pd.to_numeric(df.apply(evaluation, axis=1), errors='coerce').astype('Int64')
+    return df
+
+
+def baseline_level_conf(df_level_conf, df):
+    evaluations, fuuu_values = {}, {}
+    for _, row in df.iterrows():
+        level_name = row['level_name']
+        if pd.isna(level_name):
+            continue
+        if pd.notna(row['evaluation']):
+            evaluations.setdefault(level_name, []).append(str(row['evaluation']))
+        if pd.notna(row['fuuu']) and (pd.isna(row['evaluation']) or row['evaluation'] >= 0):
+            fuuu_values.setdefault(level_name, set()).add(int(row['fuuu']))
+
+    def rec_difficulty(level_name):
+        mapped = {FUUU_EVA[v] for v in fuuu_values.get(level_name, set()) if v in FUUU_EVA}
+        return ','.join(sorted(str(v) for v in mapped))
+
+    df_level_conf = process_attribute(df_level_conf)
+    df_level_conf['evaluation'] = df_level_conf['level_name'].map(lambda n: ','.join(evaluations.get(n, [])))
+    df_level_conf['rec_difficulty'] = df_level_conf['level_name'].map(rec_difficulty)
+    return adjust_column_order(df_level_conf)
+
+
+def baseline_pipeline(df_raw, df_level_conf, df_level_group,
+                      rules=BUILTIN_RULES, zscore_threshold=ZSCORE_THRESHOLD):
+    df = baseline_level_name(df_raw, df_level_group)
+    df = add_actual_rev(calculate_rev(add_churn_rate(df)))
+    df = baseline_zscore(df)
+    df = baseline_fuuu(df, rules)
+    df = baseline_evaluation(df, zscore_threshold)
+    return df, baseline_level_conf(df_level_conf, df)
+
+
+# 测试数据
+
+def small_inputs(seed=0):
+    """
+    2400行合成数据，event_id映射为55, 59, ..., 91，覆盖<60、新旧fuuu表两侧
+    """
+    df_raw, df_level_conf, df_level_group = make_synthetic_inputs(2400, n_level_names=150, seed=seed)
+    for frame in (df_raw, df_level_group):
+        frame['event_id'] = 55 + (frame['event_id'] - 40) * 4
+    return df_raw, df_level_conf, df_level_group
+
+
+def with_nan_event_id(seed=1):
+    df_raw, df_level_conf, df_level_group = small_inputs(seed)
+    # 含空值的event_id读入为float，key为'63.0'，与level_group不匹配（与基线行为一致）
+    df_raw = df_raw.astype({'event_id': float})
+    df_raw.loc[df_raw.index[::7], 'event_id'] = np.nan
+    return df_raw, df_level_conf, df_level_group
+
+
+def with_lv_id_over_120(seed=2):
+    df_raw, df_level_conf, df_level_group = small_inputs(seed)
+    extra = df_raw[df_raw['event_id'] >= 60].head(30).copy()
+    extra['lv_id'] = np.arange(121, 151)
+    return pd.concat([df_raw, extra], ignore_index=True), df_level_conf, df_level_group
+
+
+def with_all_event_id_below_60(seed=3):
+    df_raw, df_level_conf, df_level_group = small_inputs(seed)
+    df_raw['event_id'] = df_raw['event_id'] - 40
+    df_level_group['event_id'] = df_level_group['event_id'] - 40
+    assert (df_raw['event_id'] < 60).all()
+    return df_raw, df_level_conf, df_level_group
+
+
+CASES = {
+    'synthetic': small_inputs,
+    'nan_event_id': with_nan_event_id,
+    'lv_id_over_120': with_lv_id_over_120,
+    'all_event_id_below_60': with_all_event_id_below_60,
+}
+
+CUSTOM_RULES = [
+    (58, [(-1) ** i * (i % 7) for i in range(100)]),
+    (66, [(i % 11) - 5 for i in range(120)]),
+    (80, list(reversed(FUUU_NEW))),
+]
+
+
+def custom_rule_sheet():
+    return pd.DataFrame({
+        'event_id_start': [start for start, _ in CUSTOM_RULES],
+        'fuuu_list': [','.join(str(v) for v in curve) for _, curve in CUSTOM_RULES],
+        'version': ['test-custom', None, None]
+    })
+
+
+# 比较
+
+def missing_as_none(series):
+    return series.astype(object).where(series.notna(), None)
+
+
+def assert_same_as_baseline(result, expected):
+    df, df_level_conf, _ = result
+    df_expected, conf_expected = expected
+
+    assert list(df.columns) == list(df_expected.columns)
+    # 未匹配的level_name：merge得到NaN，逐行apply得到None
+    df = df.assign(level_name=missing_as_none(df['level_name']))
+    df_expected = df_expected.assign(level_name=missing_as_none(df_expected['level_name']))
+    # 基线的fuuu为逐行apply得到的object/float列，按数值比较
+    pd.testing.assert_series_equal(df['fuuu'].astype(float), df_expected['fuuu'].astype(float))
+    pd.testing.assert_frame_equal(df.drop(columns='fuuu'), df_expected.drop(columns='fuuu'),
+                                  check_dtype=False, rtol=1e-9)
+    # 逐行实现的字符串列在pandas 3下推断为str dtype，按值比较
+    pd.testing.assert_frame_equal(df_level_conf, conf_expected, check_dtype=False)
+
+
+@pytest.mark.parametrize('case', list(CASES))
+def test_pandas_matches_baseline(case):
+    inputs = CASES[case]()
+    assert_same_as_baseline(run_full_pipeline(*inputs), baseline_pipeline(*inputs))
+
+
+@pytest.mark.parametrize('case', list(CASES))
+def test_parallel_matches_serial(case):
+    inputs = CASES[case]()
+    df_serial, conf_serial, _ = run_full_pipeline(*inputs)
+    df_parallel, conf_parallel, _ = run_full_pipeline(*inputs, n_workers=2)
+
+    pd.testing.assert_frame_equal(df_serial, df_parallel, check_exact=True)
+    pd.testing.assert_frame_equal(conf_serial, conf_parallel, check_exact=True)
+
+
+@pytest.mark.parametrize('case', list(CASES))
+def test_polars_matches_pandas(case):
+    pytest.importorskip('polars')
+    inputs = CASES[case]()
+    df_pd, conf_pd, _ = run_full_pipeline(*inputs, engine='pandas')
+    df_pl, conf_pl, _ = run_full_pipeline(*inputs, engine='polars')
+
+    pd.testing.assert_frame_equal(df_pd, df_pl, check_dtype=False, rtol=1e-9)
+    pd.testing.assert_frame_equal(conf_pd, conf_pl)
+
+
+@pytest.mark.parametrize('case', ['synthetic', 'nan_event_id', 'lv_id_over_120'])
+def test_custom_fuuu_rules(case):
+    inputs = CASES[case]()
+    df_rules = custom_rule_sheet()
+    expected = baseline_pipeline(*inputs, rules=CUSTOM_RULES)
+
+    result = run_full_pipeline(*inputs, df_fuuu_rules=df_rules)
+    assert_same_as_baseline(result, expected)
+
+    df_parallel, conf_parallel, _ = run_full_pipeline(*inputs, df_fuuu_rules=df_rules, n_workers=2)
+    pd.testing.assert_frame_equal(result[0], df_parallel, check_exact=True)
+    pd.testing.assert_frame_equal(result[1], conf_parallel, check_exact=True)
+
+
+@pytest.mark.parametrize('case', ['synthetic', 'nan_event_id', 'lv_id_over_120'])
+def test_polars_custom_fuuu_rules(case):
+    pytest.importorskip('polars')
+    inputs = CASES[case]()
+    df_rules = custom_rule_sheet()
+    df_pd, conf_pd, _ = run_full_pipeline(*inputs, df_fuuu_rules=df_rules)
+    df_pl, conf_pl, _ = run_full_pipeline(*inputs, df_fuuu_rules=df_rules, engine='polars')
+
+    pd.testing.assert_frame_equal(df_pd, df_pl, check_dtype=False, rtol=1e-9)
+    pd.testing.assert_frame_equal(conf_pd, conf_pl)
+
+
+@pytest.mark.parametrize('zscore_threshold', [0.5, 1.5])
+def test_zscore_threshold(zscore_threshold):
+    inputs = small_inputs(seed=4)
+    expected = baseline_pipeline(*inputs, zscore_threshold=zscore_threshold)
+    assert_same_as_baseline(run_full_pipeline(*inputs, zscore_threshold=zscore_threshold), expected)
+
+
+def batch_raw_frames():
+    """
+    共用一份配置、列和类型各不相同的三个来源
+    """
+    df_a, df_level_conf, df_level_group = small_inputs(seed=5)
+    df_b = small_inputs(seed=6)[0].head(1500)
+    df_c = small_inputs(seed=7)[0].tail(900)
+
+    # b: 多一个int列
+    df_b = df_b.assign(region_id=np.arange(len(df_b)) % 3)
+    # c: 多一个字符串列，avg_start_times为int，列顺序不同
+    df_c = df_c.assign(note='c', avg_start_times=df_c['avg_start_times'].round().astype('int64'))
+    df_c = df_c[list(reversed(df_c.columns))]
+
+    return {'a': df_a, 'b': df_b, 'c': df_c}, df_level_conf, df_level_group
+
+
+@pytest.mark.parametrize('custom_rules', [False, True])
+def test_batch_matches_per_source(custom_rules):
+    raw_frames, df_level_conf, df_level_group = batch_raw_frames()
+    df_rules = custom_rule_sheet() if custom_rules else None
+
+    results = run_batch_pipeline(raw_frames, df_level_conf, df_level_group, df_fuuu_rules=df_rules)
+
+    assert list(results) == list(raw_frames)
+    for source, df_raw in raw_frames.items():
+        df, conf, _ = run_full_pipeline(df_raw, df_level_conf, df_level_group, df_fuuu_rules=df_rules)
+        df_batch, conf_batch, _ = results[source]
+        pd.testing.assert_frame_equal(df_batch, df)
+        pd.testing.assert_frame_equal(conf_batch, conf)
+
+
+def test_batch_rejects_lossy_inputs():
+    raw_frames, df_level_conf, df_level_group = batch_raw_frames()
+
+    lossy = dict(raw_frames, b=raw_frames['b'].astype({'rv_efficiency': 'float32'}))
+    with pytest.raises(ValueError, match='rv_efficiency'):
+        run_batch_pipeline(lossy, df_level_conf, df_level_group)
+
+    reserved = dict(raw_frames, c=raw_frames['c'].assign(_source='x'))
+    with pytest.raises(ValueError, match='_source'):
+        run_batch_pipeline(reserved, df_level_conf, df_level_group)
@@ -0,0 +1,128 @@
+"""
+诊断图表生成函数
+
+所有聚合与降采样都在服务端完成，浏览器只接收汇总后的少量数据点。
+"""
+import pandas as pd
+import numpy as np
+import plotly.graph_objects as go
+from typing import Optional
+
+# 散点图超过该点数时改为服务端分箱的密度图
+MAX_SCATTER_POINTS = 50000
+
+# 密度图分箱数
+DENSITY_BINS = 200
+
+
+def _finite(df: pd.DataFrame, columns) -> pd.DataFrame:
+    """
+    只保留指定列均为有限值的行
+    """
+    data = df[columns].apply(pd.to_numeric, errors='coerce')
+    mask = np.isfinite(data.to_numpy(dtype=float)).all(axis=1)
+    return data[mask]
+
+
+def build_zscore_distribution(df: pd.DataFrame, threshold: float = 1.0) -> Optional[go.Figure]:
+    """
+    按lv_id汇总z-score分布（分位数箱线图），没有有效z-score时返回None
+    """
+    data = _finite(df, ['lv_id', 'z-score'])
+    if data.empty:
+        return None
+
+    quantiles = data.groupby('lv_id')['z-score'].quantile([0.0, 0.25, 0.5, 0.75, 1.0]).unstack()
+    counts = data.groupby('lv_id').size()
+
+    fig = go.Figure(go.Box(
+        x=quantiles.index,
+        lowerfence=quantiles[0.0],
+        q1=quantiles[0.25],
+        median=quantiles[0.5],
+        q3=quantiles[0.75],
+        upperfence=quantiles[1.0],
+        customdata=counts.reindex(quantiles.index),
+        hovertemplate='lv_id=%{x}<br>样本数=%{customdata}<extra></extra>',
+        name='z-score',
+        marker_color='#1E88E5'
+    ))
+
+    for y in (threshold, -threshold):
+        fig.add_hline(y=y, line_dash='dash', line_color='#e53935')
+
+    fig.update_layout(
+        title='各lv_id的z-score分布',
+        xaxis_title='lv_id',
+        yaxis_title='z-score',
+        showlegend=False
+    )
+    return fig
+
+
+def build_rev_churn_scatter(df: pd.DataFrame,
+                            max_points: int = MAX_SCATTER_POINTS,
+                            bins: int = DENSITY_BINS) -> go.Figure:
+    """
+    actual_rev与churn_rate的散点图，数据量过大时改为分箱密度图
+    """
+    data = _finite(df, ['churn_rate', 'actual_rev'])
+    x = data['churn_rate'].to_numpy()
+    y = data['actual_rev'].to_numpy()
+
+    if len(data) <= max_points:
+        fig = go.Figure(go.Scattergl(
+            x=x,
+            y=y,
+            mode='markers',
+            marker=dict(size=4, opacity=0.5, color='#1E88E5')
+        ))
+        title = f'actual_rev vs churn_rate（{len(data)}点）'
+    else:
+        counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+        counts = np.where(counts > 0, counts, np.nan)
+        fig = go.Figure(go.Heatmap(
+            x=(x_edges[:-1] + x_edges[1:]) / 2,
+            y=(y_edges[:-1] + y_edges[1:]) / 2,
+            z=np.log10(counts.T),
+            customdata=counts.T,
+            hovertemplate='churn_rate=%{x:.3f}<br>actual_rev=%{y:.1f}<br>行数=%{customdata}<extra></extra>',
+            colorscale='Viridis',
+            colorbar=dict(title='log10(行数)')
+        ))
+        title = f'actual_rev vs churn_rate（{len(data)}行，{bins}×{bins}分箱）'
+
+    fig.update_layout(
+        title=title,
+        xaxis_title='churn_rate',
+        yaxis_title='actual_rev'
+    )
+    return fig
+
+
+def build_evaluation_heatmap(df: pd.DataFrame) -> Optional[go.Figure]:
+    """
+    event_id × lv_id 的evaluation热力图
+    """
+    data = df[['event_id', 'lv_id', 'evaluation']].dropna()
+    if data.empty:
+        return None
+
+    data = data.astype({'evaluation': float})
+    matrix = data.groupby(['event_id', 'lv_id'])['evaluation'].mean().unstack('lv_id')
+
+    fig = go.Figure(go.Heatmap(
+        x=matrix.columns,
+        y=matrix.index,
+        z=matrix.to_numpy(),
+        colorscale='RdBu',
+        zmid=0,
+        hovertemplate='event_id=%{y}<br>lv_id=%{x}<br>evaluation=%{z}<extra></extra>',
+        colorbar=dict(title='evaluation')
+    ))
+    fig.update_layout(
+        title='evaluation热力图（event_id × lv_id）',
+        xaxis_title='lv_id',
+        yaxis_title='event_id'
+    )
+    return fig
@@ -1,9 +1,20 @@
 """
 数据处理核心函数
 """
+import time
 import pandas as pd
 import numpy as np
-from typing import Dict, List, Tuple, Optional, Set
+from typing import Callable, Dict, List, Tuple, Optional, Set
+
+from utils.rule_tables import RuleTable, compile_rule_table
+from utils.pipeline_cache import Stage, StageCache, run_stages
+from utils.metrics import (
+    PIPELINE_SECONDS,
+    PIPELINE_STAGE_SECONDS,
+    PIPELINE_FAILURES,
+    ROWS_PROCESSED,
+    size_bucket
+)
 
 # 全局常量定义
 FUUU_NEW = [
@@ -22,6 +33,32 @@ FUUU_EVA = {
     6: 5, 7: 5, 8: 5, 9: 5, 10: 5
 }
 
+# event_id小于该值时使用FUUU_OLD，否则使用FUUU_NEW
+FUUU_SWITCH_EVENT_ID = 86
+
+# 默认z-score阈值
+ZSCORE_THRESHOLD = 1.0
+
+# run_full_pipeline可选的计算引擎
+ENGINES = ('pandas', 'polars')
+
+# 增量导出比较的列
+DELTA_COLUMNS = ('attribute', 'evaluation', 'rec_difficulty')
+
+# 批量处理时标记来源的临时列
+BATCH_SOURCE_COLUMN = '_source'
+
+# 参与数值计算的原始列：合并时int与float64之间的提升不改变结果，float32等低精度类型被提升后结果会改变
+_BATCH_NUMERIC_COLUMNS = ('total_churn_rate', 'in_level_churn_rate', 'avg_start_times', 'rv_efficiency')
+_BATCH_EXACT_DTYPES = {'int64', 'float64'}
+
+# 流水线阶段（用于进度回报）
+PIPELINE_STAGES = (
+    'add_level_name', 'add_churn_rate', 'calculate_rev', 'add_actual_rev',
+    'add_zscore', 'add_fuuu', 'add_evaluation',
+    'process_attribute', 'process_evaluation_conf', 'process_rec_difficulty', 'adjust_column_order'
+)
+
 ATTRIBUTE_MAP = {
     101: "gem", 102: "gem", 103: "gem", 104: "gem",
     4: "stone", 5: "ice", 1: "bomb", 15: "weaponbox",
@@ -31,6 +68,37 @@ ATTRIBUTE_MAP = {
     18: "lightsabercase", 19: "miningmachine"
 }
 
+# 向量化查表用的数组形式
+_FUUU_EVA_MIN = min(FUUU_EVA)
+_FUUU_EVA_ARRAY = np.array(
+    [FUUU_EVA.get(k, np.nan) for k in range(_FUUU_EVA_MIN, max(FUUU_EVA) + 1)],
+    dtype=float
+)
+
+
+# 内置规则表：event_id < FUUU_SWITCH_EVENT_ID 使用FUUU_OLD，其余使用FUUU_NEW
+DEFAULT_RULE_TABLE = RuleTable([-np.inf, FUUU_SWITCH_EVENT_ID], [FUUU_OLD, FUUU_NEW], version='builtin')
+
+
+def resolve_rule_table(df_fuuu_rules: Optional[pd.DataFrame] = None) -> RuleTable:
+    """
+    配置中提供fuuu_rules时编译使用，否则使用内置规则表
+    """
+    if df_fuuu_rules is None or df_fuuu_rules.empty:
+        return DEFAULT_RULE_TABLE
+    return compile_rule_table(df_fuuu_rules)
+
+
+def _lookup_fuuu_eva(fuuu: np.ndarray) -> np.ndarray:
+    """
+    按fuuu值查FUUU_EVA，不存在的返回NaN
+    """
+    idx = np.trunc(fuuu) - _FUUU_EVA_MIN
+    valid = np.isfinite(idx) & (idx >= 0) & (idx < len(_FUUU_EVA_ARRAY))
+    result = np.full(fuuu.shape, np.nan)
+    result[valid] = _FUUU_EVA_ARRAY[idx[valid].astype(np.int64)]
+    return result
+
 
 def create_lookup_dict(df_level_group: pd.DataFrame) -> Dict:
     """
@@ -59,20 +127,44 @@ def create_lookup_dict(df_level_group: pd.DataFrame) -> Dict:
     return lookup_dict
 
 
-def add_level_name(df: pd.DataFrame, df_level_group: pd.DataFrame) -> pd.DataFrame:
+def build_level_index(df_level_group: pd.DataFrame) -> pd.DataFrame:
+    """
+    将level_name查找字典展开为(event_key, ap_key, lv_id, level_name)长表，用于向量化join
+    """
+    lookup_dict = create_lookup_dict(df_level_group)
+    
+    records = [
+        (event_key, ap_key, lv_id, level_name)
+        for (event_key, ap_key), level_name_dict in lookup_dict.items()
+        for lv_id, level_name in level_name_dict.items()
+    ]
+    
+    level_index = pd.DataFrame(records, columns=['event_key', 'ap_key', 'lv_id', 'level_name'])
+    level_index['lv_id'] = level_index['lv_id'].astype('int64')
+    return level_index
+
+
+def add_level_name(df: pd.DataFrame, df_level_group: pd.DataFrame,
+                   level_index: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     添加level_name列
+    
+    level_index: 预先构建的build_level_index结果，批量处理时复用
     """
     df = df.copy()
     df['lv_id'] = df['lv_id'].astype(int)
     
-    lookup_dict = create_lookup_dict(df_level_group)
+    if level_index is None:
+        level_index = build_level_index(df_level_group)
     
-    def fast_lookup(row):
-        key = (str(row['event_id']), str(row['ap_config_version']))
-        return lookup_dict.get(key, {}).get(int(row['lv_id']))
+    keys = pd.DataFrame({
+        'event_key': df['event_id'].astype(str).to_numpy(),
+        'ap_key': df['ap_config_version'].astype(str).to_numpy(),
+        'lv_id': df['lv_id'].to_numpy(dtype='int64')
+    })
+    matched = keys.merge(level_index, on=['event_key', 'ap_key', 'lv_id'], how='left')
     
-    df['level_name'] = df.apply(fast_lookup, axis=1)
+    df['level_name'] = matched['level_name'].to_numpy()
     return df
 
 
@@ -94,11 +186,14 @@ def calculate_rev(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def add_actual_rev(df: pd.DataFrame) -> pd.DataFrame:
+def add_actual_rev(df: pd.DataFrame, by: Optional[List[str]] = None) -> pd.DataFrame:
     """
     计算actual_rev列
+    
+    by: 额外的分组列（如批量处理时的来源列），分组均值在每个分组内单独计算
     """
     df = df.copy()
+    group_keys = (by or []) + ['lv_group']
     
     # 根据lv_id创建分组
     bins = [0, 20, 40, 60, 120]
@@ -106,8 +201,9 @@ def add_actual_rev(df: pd.DataFrame) -> pd.DataFrame:
     df['lv_group'] = pd.cut(df['lv_id'], bins=bins, labels=labels, right=True)
     
     # 计算分组平均值
-    df['group_avg_rev'] = df.groupby('lv_group', observed=False)['rev'].transform('mean')
-    df['group_avg_churn_rate'] = df.groupby('lv_group', observed=False)['churn_rate'].transform('mean')
+    grouped = df.groupby(group_keys, observed=False)
+    df['group_avg_rev'] = grouped['rev'].transform('mean')
+    df['group_avg_churn_rate'] = grouped['churn_rate'].transform('mean')
     
     # 计算actual_rev
     with np.errstate(divide='ignore', invalid='ignore'):
@@ -123,21 +219,24 @@ def add_actual_rev(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def add_zscore(df: pd.DataFrame) -> pd.DataFrame:
+def add_zscore(df: pd.DataFrame, by: Optional[List[str]] = None) -> pd.DataFrame:
     """
     计算z-score列
+    
+    by: 额外的分组列（如批量处理时的来源列），统计量在每个分组内单独计算
     """
     df = df.copy()
+    group_keys = (by or []) + ['lv_id']
     
     # 筛选event_id >= 60的数据用于计算统计量
     filtered_df = df[df['event_id'] >= 60]
     
     # 计算每个lv_id的统计量
-    group_stats = filtered_df.groupby('lv_id')['actual_rev'].agg(['mean', 'std']).reset_index()
-    group_stats.columns = ['lv_id', 'mean_actual_rev', 'std_actual_rev']
+    group_stats = filtered_df.groupby(group_keys)['actual_rev'].agg(['mean', 'std']).reset_index()
+    group_stats.columns = group_keys + ['mean_actual_rev', 'std_actual_rev']
     
     # 合并回原数据
-    df = pd.merge(df, group_stats, on='lv_id', how='left')
+    df = pd.merge(df, group_stats, on=group_keys, how='left')
     
     # 计算z-score
     with np.errstate(divide='ignore', invalid='ignore'):
@@ -150,71 +249,143 @@ def add_zscore(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def add_fuuu(df: pd.DataFrame) -> pd.DataFrame:
+def add_fuuu(df: pd.DataFrame, rule_table: Optional[RuleTable] = None) -> pd.DataFrame:
     """
     添加fuuu列
+    
+    rule_table: fuuu规则表，默认使用内置的FUUU_OLD/FUUU_NEW
     """
     df = df.copy()
+    rule_table = rule_table or DEFAULT_RULE_TABLE
     
-    def get_fuuu_value(row):
-        lv_id = int(row['lv_id'])
-        
-        if row['event_id'] < 86:
-            # 使用fuuu_old
-            if 0 <= (lv_id - 1) < len(FUUU_OLD):
-                return FUUU_OLD[lv_id - 1]
-        else:
-            # 使用fuuu_new
-            if 0 <= (lv_id - 1) < len(FUUU_NEW):
-                return FUUU_NEW[lv_id - 1]
-        
-        return None
+    fuuu = rule_table.lookup(
+        pd.to_numeric(df['lv_id'], errors='coerce').to_numpy(dtype=float),
+        pd.to_numeric(df['event_id'], errors='coerce').to_numpy(dtype=float)
+    )
     
-    df['fuuu'] = df.apply(get_fuuu_value, axis=1)
+    # 与逐行查表的结果保持一致：没有缺失时为整数列
+    fuuu = pd.Series(fuuu, index=df.index)
+    if fuuu.notna().all():
+        fuuu = fuuu.astype('int64')
+    
+    df['fuuu'] = fuuu
     return df
 
 
-def add_evaluation(df: pd.DataFrame) -> pd.DataFrame:
+def add_evaluation(df: pd.DataFrame, zscore_threshold: float = ZSCORE_THRESHOLD) -> pd.DataFrame:
     """
     添加evaluation列
     """
     df = df.copy()
     
-    def assign_evaluation(row):
-        # 只处理event_id >= 60的行
-        if row['event_id'] < 60:
-            return None
-        
-        fuuu_value = row['fuuu']
-        z_score = row['z-score']
-        
-        # 检查条件
-        if pd.isna(z_score) or pd.isna(fuuu_value):
-            return None
-        
-        try:
-            fuuu_int = int(fuuu_value)
-        except (ValueError, TypeError):
-            return None
-        
-        # z-score > 1 的情况
-        if z_score > 1:
-            return FUUU_EVA.get(fuuu_int)
-        
-        # z-score < -1 的情况
-        elif z_score < -1:
-            eva_value = FUUU_EVA.get(fuuu_int)
-            if eva_value is not None:
-                return -eva_value
-        
-        return None
+    z_score = pd.to_numeric(df['z-score'], errors='coerce').to_numpy(dtype=float)
+    fuuu_eva = _lookup_fuuu_eva(pd.to_numeric(df['fuuu'], errors='coerce').to_numpy(dtype=float))
+    
+    # 只处理event_id >= 60的行
+    fuuu_eva[(df['event_id'] < 60).to_numpy(dtype=bool)] = np.nan
+    
+    # z-score > 阈值取正，< -阈值取负，其余为空
+    evaluation = np.where(z_score > zscore_threshold, fuuu_eva,
+                          np.where(z_score < -zscore_threshold, -fuuu_eva, np.nan))
     
-    df['evaluation'] = df.apply(assign_evaluation, axis=1)
-    df['evaluation'] = pd.to_numeric(df['evaluation'], errors='coerce').astype('Int64')
+    df['evaluation'] = pd.Series(evaluation, index=df.index).astype('Int64')
     
     return df
 
 
+def sweep_evaluation(df: pd.DataFrame,
+                     thresholds: List[float],
+                     switch_event_ids: List[int],
+                     rule_table: Optional[RuleTable] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    z-score阈值与fuuu表切换event_id的敏感性分析
+    
+    在已处理数据（需包含lv_id、event_id、level_name、z-score列）上，
+    一次广播计算所有组合的evaluation，返回:
+    - level_counts: 每个level_name在各组合下有evaluation的行数，
+      列为(switch_event_id, threshold)
+    - summary: 每个组合的汇总统计
+    
+    rule_table: 处理时使用的fuuu规则表（默认内置规则表），切换event_id替换其最后一条规则的起点；
+                switch_event_ids为空时只使用规则表本身的起点
+    """
+    rule_table = rule_table or DEFAULT_RULE_TABLE
+    thresholds = np.asarray(thresholds, dtype=float)
+    switch_event_ids = np.asarray(switch_event_ids, dtype=float)
+    
+    if len(switch_event_ids) == 0:
+        switch_event_ids = rule_table.starts[-1:]
+    elif len(rule_table.starts) < 2:
+        raise ValueError("当前fuuu规则表只有一条曲线，无法分析切换event_id")
+    if len(rule_table.starts) > 2 and (switch_event_ids <= rule_table.starts[-2]).any():
+        raise ValueError(f"切换event_id必须大于前一条规则的起点{rule_table.starts[-2]:g}")
+    
+    lv_id = pd.to_numeric(df['lv_id'], errors='coerce').to_numpy(dtype=float)
+    event_id = pd.to_numeric(df['event_id'], errors='coerce').to_numpy(dtype=float)
+    z_score = pd.to_numeric(df['z-score'], errors='coerce').to_numpy(dtype=float)
+    n_rows = len(df)
+    
+    # (K, n): 每条曲线下每行的evaluation绝对值，0表示无evaluation
+    column = np.trunc(lv_id) - 1
+    valid = (column >= 0) & (column < rule_table.curves.shape[1])
+    curve_fuuu = np.full((len(rule_table.starts), n_rows), np.nan)
+    curve_fuuu[:, valid] = rule_table.curves[:, column[valid].astype(np.int64)]
+    curve_eva = np.nan_to_num(_lookup_fuuu_eva(curve_fuuu)).astype(np.int8)
+    
+    # (S, n): 每个切换点下每行的evaluation绝对值
+    eva = np.zeros((len(switch_event_ids), n_rows), dtype=np.int8)
+    rows = np.arange(n_rows)
+    for i, switch_event_id in enumerate(switch_event_ids):
+        starts = rule_table.starts.copy()
+        starts[-1] = switch_event_id
+        curve = np.searchsorted(starts, event_id, side='right') - 1
+        eva[i] = np.where(curve >= 0, curve_eva[np.maximum(curve, 0), rows], 0)
+    eva[:, event_id < 60] = 0
+    
+    # (T, n): 每个阈值下每行的符号
+    sign = ((z_score > thresholds[:, np.newaxis]).astype(np.int8)
+            - (z_score < -thresholds[:, np.newaxis]).astype(np.int8))
+    
+    # (S, T, n)
+    evaluation = eva[:, np.newaxis, :] * sign[np.newaxis, :, :]
+    n_combos = len(switch_event_ids) * len(thresholds)
+    evaluation = evaluation.reshape(n_combos, -1)
+    
+    combos = pd.MultiIndex.from_product(
+        [switch_event_ids.astype(int), thresholds],
+        names=['switch_event_id', 'threshold']
+    )
+    
+    # 逐组合用bincount求各level_name的计数，只需一行布尔掩码，不复制(S·T, n)的大数组
+    codes, level_names = pd.factorize(df['level_name'], sort=True)
+    has_level = codes >= 0
+    
+    has_eva = evaluation != 0
+    counts = np.zeros((n_combos, len(level_names)), dtype=np.int64)
+    for i in range(n_combos):
+        counts[i] = np.bincount(codes[has_eva[i] & has_level], minlength=len(level_names))
+    
+    level_counts = pd.DataFrame(
+        counts.T,
+        index=pd.Index(level_names, name='level_name'),
+        columns=combos
+    )
+    
+    summary = pd.DataFrame({
+        'evaluated_rows': has_eva.sum(axis=1),
+        'positive_rows': (evaluation > 0).sum(axis=1),
+        'negative_rows': (evaluation < 0).sum(axis=1),
+        'evaluated_levels': (counts > 0).sum(axis=1)
+    }, index=combos)
+    
+    # 与当前evaluation结果比较
+    if 'evaluation' in df.columns:
+        baseline = pd.to_numeric(df['evaluation'], errors='coerce').fillna(0).to_numpy(dtype=np.int8)
+        summary['changed_rows'] = (evaluation != baseline).sum(axis=1)
+    
+    return level_counts, summary
+
+
 def process_attribute(df_level_conf: pd.DataFrame) -> pd.DataFrame:
     """
     处理attribute列
@@ -255,82 +426,73 @@ def process_attribute(df_level_conf: pd.DataFrame) -> pd.DataFrame:
     return df_level_conf
 
 
-def process_evaluation_conf(df_level_conf: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+def level_evaluations(df: pd.DataFrame, by: Optional[List[str]] = None) -> pd.Series:
     """
-    处理df_level_conf中的evaluation列
+    每个level_name的evaluation列表（按原数据行顺序以逗号拼接）
+    
+    by: 额外的分组列，结果索引为(by..., level_name)
     """
-    df_level_conf = df_level_conf.copy()
+    keys = (by or []) + ['level_name']
+    valid = df.dropna(subset=['level_name', 'evaluation'])
+    return (valid['evaluation'].astype(str)
+            .groupby([valid[key] for key in keys], sort=False)
+            .agg(','.join))
+
+
+def level_rec_difficulty(df: pd.DataFrame, by: Optional[List[str]] = None) -> pd.Series:
+    """
+    每个level_name的rec_difficulty（evaluation为空或>=0的行的fuuu映射值，去重排序后拼接）
     
-    # 创建level_name到evaluation列表的映射
-    level_evaluation_dict = {}
+    by: 额外的分组列，结果索引为(by..., level_name)
+    """
+    keys = (by or []) + ['level_name']
+    
+    # 条件：evaluation为空值或>=0
+    evaluation = df['evaluation']
+    mask = (df['level_name'].notna() & df['fuuu'].notna()
+            & (evaluation.isna() | (evaluation >= 0)).fillna(False).astype(bool))
+    
+    # fuuu映射为FUUU_EVA，去重后按level_name拼接
+    pairs = df.loc[mask, keys].reset_index(drop=True)
+    pairs['rec'] = _lookup_fuuu_eva(pd.to_numeric(df.loc[mask, 'fuuu'], errors='coerce').to_numpy(dtype=float))
+    pairs = pairs.dropna(subset=['rec'])
+    pairs['rec'] = pairs['rec'].astype(int).astype(str)
+    
+    return (pairs.drop_duplicates()
+            .sort_values('rec', kind='stable')
+            .groupby(keys, sort=False)['rec']
+            .agg(','.join))
+
+
+def process_evaluation_conf(df_level_conf: pd.DataFrame, df: pd.DataFrame,
+                            evaluations: Optional[pd.Series] = None) -> pd.DataFrame:
+    """
+    处理df_level_conf中的evaluation列
     
-    for _, row in df.iterrows():
-        level_name = row['level_name']
-        evaluation = row['evaluation']
-        
-        if pd.isna(level_name) or pd.isna(evaluation):
-            continue
-        
-        if level_name not in level_evaluation_dict:
-            level_evaluation_dict[level_name] = []
-        
-        level_evaluation_dict[level_name].append(str(evaluation))
+    evaluations: 预先计算的level_evaluations结果，提供时不再扫描df
+    """
+    df_level_conf = df_level_conf.copy()
     
-    def get_evaluations_for_level(level_name):
-        if pd.isna(level_name):
-            return ""
-        
-        evaluations = level_evaluation_dict.get(level_name, [])
-        return ','.join(evaluations)
+    if evaluations is None:
+        evaluations = level_evaluations(df)
     
-    df_level_conf['evaluation'] = df_level_conf['level_name'].apply(get_evaluations_for_level)
+    df_level_conf['evaluation'] = df_level_conf['level_name'].map(evaluations).fillna('')
     return df_level_conf
 
 
-def process_rec_difficulty(df_level_conf: pd.DataFrame, df: pd.DataFrame) -> pd.DataFrame:
+def process_rec_difficulty(df_level_conf: pd.DataFrame, df: pd.DataFrame,
+                           rec_difficulty: Optional[pd.Series] = None) -> pd.DataFrame:
     """
     处理rec_difficulty列
+    
+    rec_difficulty: 预先计算的level_rec_difficulty结果，提供时不再扫描df
     """
     df_level_conf = df_level_conf.copy()
     
-    # 创建level_name到fuuu值的映射
-    level_fuuu_dict = {}
-    
-    for _, row in df.iterrows():
-        level_name = row['level_name']
-        evaluation = row['evaluation']
-        fuuu_value = row['fuuu']
-        
-        if pd.isna(level_name) or pd.isna(fuuu_value):
-            continue
-        
-        # 条件：evaluation为空值或>=0
-        if pd.isna(evaluation) or evaluation >= 0:
-            if level_name not in level_fuuu_dict:
-                level_fuuu_dict[level_name] = set()
-            
-            try:
-                fuuu_int = int(fuuu_value)
-                level_fuuu_dict[level_name].add(fuuu_int)
-            except (ValueError, TypeError):
-                continue
-    
-    def calculate_rec_difficulty(level_name):
-        if pd.isna(level_name):
-            return ""
-        
-        fuuu_values = level_fuuu_dict.get(level_name, set())
-        if not fuuu_values:
-            return ""
-        
-        mapped_values = set()
-        for fuuu_val in fuuu_values:
-            if fuuu_val in FUUU_EVA:
-                mapped_values.add(FUUU_EVA[fuuu_val])
-        
-        return ','.join(sorted(str(val) for val in mapped_values))
+    if rec_difficulty is None:
+        rec_difficulty = level_rec_difficulty(df)
     
-    df_level_conf['rec_difficulty'] = df_level_conf['level_name'].apply(calculate_rec_difficulty)
+    df_level_conf['rec_difficulty'] = df_level_conf['level_name'].map(rec_difficulty).fillna('')
     return df_level_conf
 
 
@@ -359,30 +521,286 @@ def adjust_column_order(df_level_conf: pd.DataFrame) -> pd.DataFrame:
     return df_level_conf
 
 
+def _normalize_conf_value(value) -> str:
+    """
+    统一配置单元格的文本形式（空值为空串，整数值的浮点数去掉小数部分）
+    """
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return ''
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def build_level_conf_delta(df_level_conf_old: pd.DataFrame,
+                           df_level_conf_new: pd.DataFrame,
+                           columns: Tuple[str, ...] = DELTA_COLUMNS) -> Tuple[pd.DataFrame, Dict]:
+    """
+    以level_name为键比较新计算的level_conf与上传的level_conf
+    
+    返回:
+    - patch: 只包含有变化的行和列（第一列为level_name）
+    - summary: 变更摘要
+    """
+    def keyed(df_conf: pd.DataFrame) -> pd.DataFrame:
+        df_conf = df_conf.dropna(subset=['level_name']).drop_duplicates('level_name', keep='first')
+        values = df_conf.set_index('level_name').reindex(columns=list(columns))
+        return values.apply(lambda col: col.map(_normalize_conf_value))
+    
+    new_values = keyed(df_level_conf_new)
+    old_values = keyed(df_level_conf_old).reindex(new_values.index).fillna('')
+    
+    changed = new_values.ne(old_values)
+    changed_rows = changed.any(axis=1)
+    changed_columns = [col for col in columns if changed[col].any()]
+    
+    patch = new_values.loc[changed_rows, changed_columns].reset_index()
+    
+    new_levels = ~new_values.index.isin(df_level_conf_old['level_name'].dropna())
+    summary = {
+        'total_levels': int(len(new_values)),
+        'changed_levels': int(changed_rows.sum()),
+        'new_levels': int(new_levels.sum()),
+        'changed_cells': {col: int(changed[col].sum()) for col in columns},
+        'changed_ratio': float(changed_rows.mean()) if len(new_values) else 0.0
+    }
+    
+    return patch, summary
+
+
+def _parallel_level_stages(df: pd.DataFrame, zscore_threshold: float, rule_table: RuleTable, n_workers: int):
+    from utils.parallel import run_parallel_level_stages
+    return run_parallel_level_stages(df, n_workers, zscore_threshold, rule_table)
+
+
+# pandas引擎的阶段声明：输入（源数据或上游阶段）、读取的源数据列、参数
+# 只缓存能被单独复用的阶段：add_level_name到add_actual_rev没有参数、任一输入变化时同时失效，
+# 缓存add_zscore即可覆盖它们（多进程模式下add_actual_rev是阈值或规则表变化时可复用的阶段）；
+# level_conf的聚合阶段依赖主数据结果，只在输入完全不变时命中，不缓存
+_LEVEL_GROUP_COLUMNS = ('event_id', 'ap_config_version', 'level_name_list', 'hidden_level_list')
+
+_MAIN_STAGES = [
+    Stage('add_level_name', add_level_name, ['df_raw', 'df_level_group'],
+          columns={'df_level_group': _LEVEL_GROUP_COLUMNS}, cacheable=False),
+    Stage('add_churn_rate', add_churn_rate, ['add_level_name'], cacheable=False),
+    Stage('calculate_rev', calculate_rev, ['add_churn_rate'], cacheable=False)
+]
+
+SERIAL_STAGES = _MAIN_STAGES + [
+    Stage('add_actual_rev', add_actual_rev, ['calculate_rev'], cacheable=False),
+    Stage('add_zscore', add_zscore, ['add_actual_rev']),
+    Stage('add_fuuu', add_fuuu, ['add_zscore'], params=['rule_table']),
+    Stage('add_evaluation', add_evaluation, ['add_fuuu'], params=['zscore_threshold']),
+    Stage('process_attribute', process_attribute, ['df_level_conf']),
+    Stage('process_evaluation_conf', process_evaluation_conf, ['process_attribute', 'add_evaluation'],
+          cacheable=False),
+    Stage('process_rec_difficulty', process_rec_difficulty, ['process_evaluation_conf', 'add_evaluation'],
+          cacheable=False),
+    Stage('adjust_column_order', adjust_column_order, ['process_rec_difficulty'], cacheable=False)
+]
+
+# 多进程模式：parallel_level_stages的结果为(df, level_evaluations, level_rec_difficulty)
+PARALLEL_STAGES = _MAIN_STAGES + [
+    Stage('add_actual_rev', add_actual_rev, ['calculate_rev']),
+    Stage('parallel_level_stages', _parallel_level_stages, ['add_actual_rev'],
+          params=['zscore_threshold', 'rule_table', 'n_workers']),
+    Stage('process_attribute', process_attribute, ['df_level_conf']),
+    Stage('process_evaluation_conf',
+          lambda c, r: process_evaluation_conf(c, r[0], evaluations=r[1]),
+          ['process_attribute', 'parallel_level_stages'], cacheable=False),
+    Stage('process_rec_difficulty',
+          lambda c, r: process_rec_difficulty(c, r[0], rec_difficulty=r[2]),
+          ['process_evaluation_conf', 'parallel_level_stages'], cacheable=False),
+    Stage('adjust_column_order', adjust_column_order, ['process_rec_difficulty'], cacheable=False)
+]
+
+
 def run_full_pipeline(df_raw: pd.DataFrame, 
                      df_level_conf: pd.DataFrame, 
-                     df_level_group: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+                     df_level_group: pd.DataFrame,
+                     zscore_threshold: float = ZSCORE_THRESHOLD,
+                     engine: str = 'pandas',
+                     progress_callback: Optional[Callable[[str, float], None]] = None,
+                     df_fuuu_rules: Optional[pd.DataFrame] = None,
+                     n_workers: int = 1,
+                     cache: Optional[StageCache] = None) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
     运行完整的数据处理流水线
+    
+    engine: 'pandas'（默认）或 'polars'（多线程列式引擎，需要安装polars）
+    progress_callback: 每个阶段开始前调用 progress_callback(阶段名, 已完成比例)，
+                       结束时调用 progress_callback('done', 1.0)
+    df_fuuu_rules: 配置文件中可选的fuuu_rules sheet，为空时使用内置规则表
+    n_workers: pandas引擎下大于1时，z-score/fuuu/evaluation及level_conf聚合
+               在共享内存上多进程执行（见utils.parallel），结果与串行一致
+    cache: pandas引擎的阶段结果缓存，输入未变化的阶段直接复用上次结果
+           （如只修改level_conf时只重跑process_attribute及配置相关阶段）。
+           返回的DataFrame可能来自缓存，不应原地修改
     """
+    if engine not in ENGINES:
+        raise ValueError(f"未知的计算引擎: {engine}，可选: {', '.join(ENGINES)}")
+    
+    bucket = size_bucket(len(df_raw))
+    rule_table = resolve_rule_table(df_fuuu_rules)
+    
+    def report(stage: str, fraction: float):
+        if progress_callback is not None:
+            progress_callback(stage, fraction)
+    
+    def run_stage(stage: str, func, data):
+        try:
+            with PIPELINE_STAGE_SECONDS.time(stage=stage, size_bucket=bucket):
+                return func(data)
+        except Exception:
+            PIPELINE_FAILURES.inc(stage=stage)
+            raise
+    
     print("开始数据处理流程...")
+    pipeline_start = time.perf_counter()
+    
+    if engine == 'polars':
+        from utils.polars_engine import run_polars_pipeline
+        report('polars', 0.0)
+        df, df_level_conf = run_stage(
+            'polars',
+            lambda d: run_polars_pipeline(d, df_level_conf, df_level_group, zscore_threshold, rule_table),
+            df_raw
+        )
+    else:
+        stages = PARALLEL_STAGES if n_workers > 1 and len(df_raw) > 0 else SERIAL_STAGES
+        sources = {'df_raw': df_raw, 'df_level_conf': df_level_conf, 'df_level_group': df_level_group}
+        params = {'zscore_threshold': zscore_threshold, 'rule_table': rule_table, 'n_workers': n_workers}
+        n_stages = len(PIPELINE_STAGES)
+        executed = []
+        
+        def execute(stage: Stage, values: Tuple):
+            report(stage.name, len(executed) / n_stages)
+            executed.append(stage.name)
+            kwargs = {name: params[name] for name in stage.params}
+            return run_stage(stage.name, lambda _: stage.func(*values, **kwargs), None)
+        
+        main_target = 'parallel_level_stages' if stages is PARALLEL_STAGES else 'add_evaluation'
+        results = run_stages(stages, [main_target, 'adjust_column_order'], sources, params,
+                             cache=cache, run_stage=execute)
+        
+        df = results[main_target]
+        if isinstance(df, tuple):
+            df = df[0]
+        df_level_conf = results['adjust_column_order']
+        
+        if cache is not None:
+            skipped = [stage.name for stage in stages if stage.name not in executed]
+            print(f"复用缓存阶段: {', '.join(skipped) or '无'}")
+    
+    PIPELINE_SECONDS.observe(time.perf_counter() - pipeline_start, engine=engine, size_bucket=bucket)
+    ROWS_PROCESSED.inc(len(df_raw), engine=engine)
+    
+    report('done', 1.0)
+    print("数据处理完成！")
+    return df, df_level_conf, df_level_group
+
+
+def _select_source(series: pd.Series, source) -> pd.Series:
+    """
+    从(来源, level_name)索引的结果中取出单个来源
+    """
+    if series.empty or source not in series.index.get_level_values(0):
+        return pd.Series(dtype=object)
+    return series.xs(source, level=0)
+
+
+def run_batch_pipeline(raw_frames: Dict[str, pd.DataFrame],
+                       df_level_conf: pd.DataFrame,
+                       df_level_group: pd.DataFrame,
+                       zscore_threshold: float = ZSCORE_THRESHOLD,
+                       df_fuuu_rules: Optional[pd.DataFrame] = None) -> Dict[str, Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]]:
+    """
+    批量处理共用同一份配置的多个原始数据（如不同版本或地区）
+    
+    所有原始数据合并后一次性处理，分组统计（actual_rev、z-score、level_conf聚合）
+    按来源分别计算；level_name索引和attribute解析只做一次。
+    结果与对每个来源单独调用run_full_pipeline一致。
     
-    # 处理主数据
-    df = df_raw.copy()
-    df = add_level_name(df, df_level_group)
+    返回: {来源: (df, df_level_conf, df_level_group)}
+    """
+    for source, frame in raw_frames.items():
+        if BATCH_SOURCE_COLUMN in frame.columns:
+            raise ValueError(f"来源{source}的原始数据不能包含保留列{BATCH_SOURCE_COLUMN}")
+    
+    # level_name按event_id、ap_config_version的文本形式匹配，合并时类型提升（如int→float）会改变匹配结果
+    for col in ('event_id', 'ap_config_version'):
+        dtypes = {str(frame[col].dtype) for frame in raw_frames.values() if col in frame.columns}
+        if len(dtypes) > 1:
+            raise ValueError(f"各来源的{col}列类型不一致: {sorted(dtypes)}")
+    for col in _BATCH_NUMERIC_COLUMNS:
+        dtypes = {str(frame[col].dtype) for frame in raw_frames.values() if col in frame.columns}
+        if len(dtypes) > 1 and not dtypes <= _BATCH_EXACT_DTYPES:
+            raise ValueError(f"各来源的{col}列类型不一致: {sorted(dtypes)}")
+    
+    print(f"开始批量数据处理流程（{len(raw_frames)}个来源）...")
+    pipeline_start = time.perf_counter()
+    
+    sources = list(raw_frames)
+    by = [BATCH_SOURCE_COLUMN]
+    
+    # 共用的准备工作
+    level_index = build_level_index(df_level_group)
+    rule_table = resolve_rule_table(df_fuuu_rules)
+    df_level_conf_base = process_attribute(df_level_conf)
+    
+    # 合并所有来源
+    df = pd.concat(
+        [frame.assign(**{BATCH_SOURCE_COLUMN: source}) for source, frame in raw_frames.items()],
+        ignore_index=True
+    )
+    
+    df = add_level_name(df, df_level_group, level_index=level_index)
     df = add_churn_rate(df)
     df = calculate_rev(df)
-    df = add_actual_rev(df)
-    df = add_zscore(df)
-    df = add_fuuu(df)
-    df = add_evaluation(df)
+    df = add_actual_rev(df, by=by)
+    df = add_zscore(df, by=by)
+    df = add_fuuu(df, rule_table)
+    df = add_evaluation(df, zscore_threshold)
+    
+    evaluations = level_evaluations(df, by=by)
+    rec_difficulty = level_rec_difficulty(df, by=by)
+    
+    # 按来源拆分结果，每个来源只保留自己的原始列和新增的结果列
+    raw_columns = set().union(*(frame.columns for frame in raw_frames.values()))
+    added_columns = [col for col in df.columns if col not in raw_columns and col != BATCH_SOURCE_COLUMN]
+    parts = {source: part for source, part in df.groupby(BATCH_SOURCE_COLUMN, sort=False)}
+    
+    results = {}
+    for source in sources:
+        frame_columns = list(raw_frames[source].columns)
+        columns = frame_columns + [col for col in added_columns if col not in frame_columns]
+        
+        part = parts.get(source, df.iloc[0:0])
+        df_source = part[columns].reset_index(drop=True)
+        
+        # 合并时缺列的来源被补NaN，会把其他来源的int列提升为float，恢复为该来源原本的类型
+        # （lv_id在add_level_name中统一转为int，与单独处理时一致）
+        restore = {
+            col: dtype for col, dtype in raw_frames[source].dtypes.items()
+            if col != 'lv_id' and df_source[col].dtype != dtype
+        }
+        if restore:
+            df_source = df_source.astype(restore)
+        
+        # 其他来源的fuuu有缺失时合并结果为float列，与add_fuuu一致：该来源没有缺失时为整数列
+        if df_source['fuuu'].notna().all() and df_source['fuuu'].dtype != 'int64':
+            df_source['fuuu'] = df_source['fuuu'].astype('int64')
+        
+        df_level_conf_source = process_evaluation_conf(
+            df_level_conf_base, df_source, evaluations=_select_source(evaluations, source))
+        df_level_conf_source = process_rec_difficulty(
+            df_level_conf_source, df_source, rec_difficulty=_select_source(rec_difficulty, source))
+        df_level_conf_source = adjust_column_order(df_level_conf_source)
+        
+        results[source] = (df_source, df_level_conf_source, df_level_group)
     
-    # 处理配置数据
-    df_level_conf = df_level_conf.copy()
-    df_level_conf = process_attribute(df_level_conf)
-    df_level_conf = process_evaluation_conf(df_level_conf, df)
-    df_level_conf = process_rec_difficulty(df_level_conf, df)
-    df_level_conf = adjust_column_order(df_level_conf)
+    PIPELINE_SECONDS.observe(time.perf_counter() - pipeline_start, engine='batch', size_bucket=size_bucket(len(df)))
+    ROWS_PROCESSED.inc(len(df), engine='batch')
     
-    print("数据处理完成！")
-    return df, df_level_conf, df_level_group
\ No newline at end of file
+    print("批量数据处理完成！")
+    return results
@@ -5,25 +5,142 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 import io
-from typing import Dict, Tuple
+import os
+import atexit
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple, Optional
+
+from utils.metrics import (
+    PARSE_SECONDS,
+    PARSE_BYTES,
+    EXPORT_SECONDS,
+    VALIDATION_FAILURES,
+    byte_size_bucket,
+    record_cache
+)
+
+# 延迟生成的Excel导出文件缓存：result_key -> 临时文件路径
+_EXPORT_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_EXPORT_CACHE_LOCK = threading.Lock()
+MAX_CACHED_EXPORTS = 32
+
+# 各数据表的必需列
+REQUIRED_COLUMNS = {
+    'df_raw': ['event_id', 'ap_config_version', 'lv_id',
+               'total_churn_rate', 'in_level_churn_rate',
+               'avg_start_times', 'rv_efficiency'],
+    'df_level_conf': ['level_name', 'target'],
+    'df_level_group': ['event_id', 'ap_config_version', 'level_name_list', 'hidden_level_list']
+}
+
+
+def read_raw_file(uploaded_file_raw) -> pd.DataFrame:
+    """
+    读取原始数据文件
+    """
+    try:
+        return pd.read_excel(uploaded_file_raw)
+    except Exception as e:
+        raise ValueError(f"读取文件失败: {str(e)}")
+
+
+def read_conf_file(uploaded_file_conf) -> Tuple[pd.DataFrame, pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    读取配置文件（level_conf、level_group和可选的fuuu_rules，工作簿只打开一次）
+    
+    返回: (df_level_conf, df_level_group, df_fuuu_rules)，没有fuuu_rules sheet时最后一项为None
+    """
+    from utils.rule_tables import RULE_SHEET_NAME
+    
+    try:
+        with pd.ExcelFile(uploaded_file_conf) as workbook:
+            df_level_conf = workbook.parse('level_conf')
+            df_level_group = workbook.parse('level_group')
+            df_fuuu_rules = workbook.parse(RULE_SHEET_NAME) if RULE_SHEET_NAME in workbook.sheet_names else None
+    except Exception as e:
+        raise ValueError(f"读取文件失败: {str(e)}")
+    
+    return df_level_conf, df_level_group, df_fuuu_rules
 
 
 def read_uploaded_files(uploaded_file_raw, uploaded_file_conf) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
     """
     读取上传的文件
     """
+    n_bytes = _file_size(uploaded_file_raw) + _file_size(uploaded_file_conf)
+    start = time.perf_counter()
+    
+    df_raw = read_raw_file(uploaded_file_raw)
+    df_level_conf, df_level_group, _ = read_conf_file(uploaded_file_conf)
+    
+    PARSE_SECONDS.observe(time.perf_counter() - start, size_bucket=byte_size_bucket(n_bytes))
+    PARSE_BYTES.inc(n_bytes)
+    
+    return df_raw, df_level_conf, df_level_group
+
+
+def read_rule_sheet(uploaded_file_conf) -> Optional[pd.DataFrame]:
+    """
+    读取配置文件中可选的fuuu_rules sheet，不存在时返回None
+    """
+    from utils.rule_tables import RULE_SHEET_NAME
+    
+    if hasattr(uploaded_file_conf, 'seek'):
+        uploaded_file_conf.seek(0)
+    
     try:
-        # 读取原始数据
-        df_raw = pd.read_excel(uploaded_file_raw)
-        
-        # 读取配置文件（包含两个sheet）
-        df_level_conf = pd.read_excel(uploaded_file_conf, sheet_name='level_conf')
-        df_level_group = pd.read_excel(uploaded_file_conf, sheet_name='level_group')
-        
-        return df_raw, df_level_conf, df_level_group
-        
+        with pd.ExcelFile(uploaded_file_conf) as workbook:
+            if RULE_SHEET_NAME not in workbook.sheet_names:
+                return None
+            return workbook.parse(RULE_SHEET_NAME)
     except Exception as e:
-        raise ValueError(f"读取文件失败: {str(e)}")
+        raise ValueError(f"读取{RULE_SHEET_NAME}失败: {str(e)}")
+    finally:
+        if hasattr(uploaded_file_conf, 'seek'):
+            uploaded_file_conf.seek(0)
+
+
+def _file_size(uploaded_file) -> int:
+    """
+    上传文件的字节数（无法获取时返回0）
+    """
+    size = getattr(uploaded_file, 'size', None)
+    if size is not None:
+        return int(size)
+    try:
+        return os.path.getsize(uploaded_file)
+    except (TypeError, OSError):
+        return 0
+
+
+def read_table(data: bytes, filename: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
+    """
+    按扩展名读取表格数据（xlsx/xls/parquet/csv）
+    """
+    ext = os.path.splitext(filename.lower())[1]
+    
+    with PARSE_SECONDS.time(size_bucket=byte_size_bucket(len(data))):
+        if ext in ('.xlsx', '.xls'):
+            df = pd.read_excel(io.BytesIO(data), sheet_name=sheet_name or 0)
+        elif ext == '.parquet':
+            df = pd.read_parquet(io.BytesIO(data))
+        elif ext == '.csv':
+            df = pd.read_csv(io.BytesIO(data))
+        else:
+            raise ValueError(f"不支持的文件格式: {filename}")
+    
+    PARSE_BYTES.inc(len(data))
+    return df
+
+
+def missing_columns(df: pd.DataFrame, frame: str) -> List[str]:
+    """
+    df相对于REQUIRED_COLUMNS[frame]缺少的列
+    """
+    return [col for col in REQUIRED_COLUMNS[frame] if col not in df.columns]
 
 
 def validate_dataframes(df_raw: pd.DataFrame, 
@@ -40,44 +157,122 @@ def validate_dataframes(df_raw: pd.DataFrame,
         'missing_columns': {}
     }
     
-    # 检查df_raw的必需列
-    df_raw_required = ['event_id', 'ap_config_version', 'lv_id', 
-                      'total_churn_rate', 'in_level_churn_rate',
-                      'avg_start_times', 'rv_efficiency']
-    missing_raw = [col for col in df_raw_required if col not in df_raw.columns]
-    validation_results['df_raw_valid'] = len(missing_raw) == 0
-    validation_results['required_columns']['df_raw'] = df_raw_required
-    validation_results['missing_columns']['df_raw'] = missing_raw
-    
-    # 检查df_level_conf的必需列
-    level_conf_required = ['level_name', 'target']
-    missing_conf = [col for col in level_conf_required if col not in df_level_conf.columns]
-    validation_results['df_level_conf_valid'] = len(missing_conf) == 0
-    validation_results['required_columns']['df_level_conf'] = level_conf_required
-    validation_results['missing_columns']['df_level_conf'] = missing_conf
-    
-    # 检查df_level_group的必需列
-    level_group_required = ['event_id', 'ap_config_version', 'level_name_list', 'hidden_level_list']
-    missing_group = [col for col in level_group_required if col not in df_level_group.columns]
-    validation_results['df_level_group_valid'] = len(missing_group) == 0
-    validation_results['required_columns']['df_level_group'] = level_group_required
-    validation_results['missing_columns']['df_level_group'] = missing_group
+    frames = {'df_raw': df_raw, 'df_level_conf': df_level_conf, 'df_level_group': df_level_group}
+    for frame, df in frames.items():
+        missing = missing_columns(df, frame)
+        validation_results[f'{frame}_valid'] = len(missing) == 0
+        validation_results['required_columns'][frame] = REQUIRED_COLUMNS[frame]
+        validation_results['missing_columns'][frame] = missing
+        if missing:
+            VALIDATION_FAILURES.inc(frame=frame)
     
     return validation_results
 
 
+def write_excel_output(df_level_conf: pd.DataFrame, 
+                       df_level_group: pd.DataFrame,
+                       output) -> None:
+    """
+    将结果写入Excel（output可以是文件路径或文件对象）
+    """
+    with EXPORT_SECONDS.time(format='xlsx'):
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            df_level_conf.to_excel(writer, sheet_name='level_conf', index=False)
+            df_level_group.to_excel(writer, sheet_name='level_group', index=False)
+
+
 def generate_excel_output(df_level_conf: pd.DataFrame, 
                          df_level_group: pd.DataFrame) -> bytes:
     """
     生成Excel输出文件
     """
     output = io.BytesIO()
+    write_excel_output(df_level_conf, df_level_group, output)
+    return output.getvalue()
+
+
+def generate_parquet_output(df: pd.DataFrame) -> bytes:
+    """
+    生成Parquet输出文件
+    """
+    output = io.BytesIO()
+    with EXPORT_SECONDS.time(format='parquet'):
+        df.to_parquet(output, index=False)
+    return output.getvalue()
+
+
+def generate_delta_output(df_patch: pd.DataFrame) -> bytes:
+    """
+    生成增量补丁文件（CSV）
+    """
+    with EXPORT_SECONDS.time(format='delta_csv'):
+        return df_patch.to_csv(index=False).encode('utf-8-sig')
+
+
+def get_cached_export(result_key: str) -> Optional[str]:
+    """
+    返回已生成的导出文件路径，未生成时返回None
+    """
+    with _EXPORT_CACHE_LOCK:
+        path = _EXPORT_CACHE.get(result_key)
+        if path is not None and not os.path.exists(path):
+            del _EXPORT_CACHE[result_key]
+            return None
+        return path
+
+
+def get_excel_export(result_key: str,
+                     df_level_conf: pd.DataFrame, 
+                     df_level_group: pd.DataFrame) -> str:
+    """
+    按结果标识获取Excel导出文件路径，首次请求时写入临时文件，之后复用
+    """
+    path = get_cached_export(result_key)
+    record_cache('excel_export', path is not None)
+    if path is not None:
+        return path
     
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df_level_conf.to_excel(writer, sheet_name='level_conf', index=False)
-        df_level_group.to_excel(writer, sheet_name='level_group', index=False)
+    fd, path = tempfile.mkstemp(prefix='level_conf_', suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_excel_output(df_level_conf, df_level_group, path)
+    except Exception:
+        os.remove(path)
+        raise
     
-    return output.getvalue()
+    with _EXPORT_CACHE_LOCK:
+        _EXPORT_CACHE[result_key] = path
+        
+        # 超出上限时删除最早生成的文件
+        while len(_EXPORT_CACHE) > MAX_CACHED_EXPORTS:
+            _, old_path = _EXPORT_CACHE.popitem(last=False)
+            _remove_file(old_path)
+    
+    return path
+
+
+def release_excel_export(result_key: str) -> None:
+    """
+    删除结果对应的导出文件
+    """
+    with _EXPORT_CACHE_LOCK:
+        path = _EXPORT_CACHE.pop(result_key, None)
+    if path is not None:
+        _remove_file(path)
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@atexit.register
+def _cleanup_exports() -> None:
+    with _EXPORT_CACHE_LOCK:
+        while _EXPORT_CACHE:
+            _remove_file(_EXPORT_CACHE.popitem()[1])
 
 
 def generate_filename() -> str:
@@ -0,0 +1,155 @@
+"""
+本地历史结果存储
+
+每次处理结果按event_id和ap_config_version分区写入Parquet数据集
+（hive目录格式），同一分区重复写入时整体替换，查询时按分区裁剪并下推过滤条件。
+"""
+import os
+import uuid
+from datetime import datetime
+from urllib.parse import quote
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from typing import List, Optional
+
+DEFAULT_HISTORY_DIR = os.environ.get(
+    'LEVEL_HISTORY_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'history')
+)
+
+PARTITION_SCHEMA = pa.schema([
+    ('event_id', pa.int64()),
+    ('ap_config_version', pa.string())
+])
+
+HISTORY_SCHEMA = pa.schema([
+    ('lv_id', pa.int64()),
+    ('level_name', pa.string()),
+    ('total_churn_rate', pa.float64()),
+    ('in_level_churn_rate', pa.float64()),
+    ('avg_start_times', pa.float64()),
+    ('rv_efficiency', pa.float64()),
+    ('churn_rate', pa.float64()),
+    ('rev', pa.float64()),
+    ('actual_rev', pa.float64()),
+    ('z-score', pa.float64()),
+    ('fuuu', pa.int64()),
+    ('evaluation', pa.int64()),
+    ('processed_at', pa.timestamp('us'))
+])
+
+_PART_FILE = 'part-0.parquet'
+
+
+def _partition_dir(root: str, event_id: int, ap_config_version: str) -> str:
+    """
+    分区目录路径（分区值按URI编码）
+    """
+    return os.path.join(
+        root,
+        f'event_id={int(event_id)}',
+        f'ap_config_version={quote(str(ap_config_version), safe="")}'
+    )
+
+
+def _to_history_table(df: pd.DataFrame, processed_at: datetime) -> pa.Table:
+    """
+    将处理结果转换为固定schema的Arrow表（不含分区列）
+    """
+    arrays = []
+    for field in HISTORY_SCHEMA:
+        if field.name == 'processed_at':
+            arrays.append(pa.array([processed_at] * len(df), type=field.type))
+        elif field.name == 'level_name':
+            arrays.append(pa.array(df['level_name'].astype(object), type=field.type, from_pandas=True))
+        elif pa.types.is_integer(field.type):
+            arrays.append(pa.array(pd.to_numeric(df[field.name], errors='coerce').astype('Int64'),
+                                   type=field.type, from_pandas=True))
+        else:
+            arrays.append(pa.array(pd.to_numeric(df[field.name], errors='coerce'),
+                                   type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=HISTORY_SCHEMA)
+
+
+def append_results(df_processed: pd.DataFrame, root: Optional[str] = None) -> int:
+    """
+    将run_full_pipeline的结果写入历史数据集，返回写入的分区数
+
+    已存在的分区整体替换，因此同一event重复处理不会产生重复数据。
+    event_id或ap_config_version为空的行不写入。
+    """
+    root = root or DEFAULT_HISTORY_DIR
+    processed_at = datetime.now()
+
+    df = df_processed.dropna(subset=['event_id', 'ap_config_version'])
+    keys = pd.DataFrame({
+        'event_id': pd.to_numeric(df['event_id'], errors='coerce').astype('int64'),
+        'ap_config_version': df['ap_config_version'].astype(str)
+    }, index=df.index)
+
+    written = 0
+    for (event_id, ap_config_version), index in keys.groupby(['event_id', 'ap_config_version'], sort=False).groups.items():
+        partition = df.loc[index].sort_values('lv_id', kind='stable')
+        table = _to_history_table(partition, processed_at)
+
+        partition_dir = _partition_dir(root, event_id, ap_config_version)
+        os.makedirs(partition_dir, exist_ok=True)
+
+        # 先写临时文件再原子替换，读者不会看到写了一半的分区
+        tmp_path = os.path.join(partition_dir, f'.{uuid.uuid4().hex}.tmp')
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, os.path.join(partition_dir, _PART_FILE))
+        written += 1
+
+    return written
+
+
+def query_history(root: Optional[str] = None,
+                  lv_ids: Optional[List[int]] = None,
+                  level_names: Optional[List[str]] = None,
+                  event_ids: Optional[List[int]] = None,
+                  ap_config_versions: Optional[List[str]] = None,
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    查询历史数据
+
+    event_id、ap_config_version条件用于分区裁剪，lv_id、level_name条件下推到Parquet扫描。
+    """
+    root = root or DEFAULT_HISTORY_DIR
+    all_columns = [field.name for field in PARTITION_SCHEMA] + HISTORY_SCHEMA.names
+    columns = columns or all_columns
+
+    if not os.path.isdir(root):
+        return pd.DataFrame(columns=columns)
+
+    dataset = ds.dataset(
+        root,
+        schema=pa.unify_schemas([HISTORY_SCHEMA, PARTITION_SCHEMA]),
+        format='parquet',
+        partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+    )
+
+    conditions = []
+    if event_ids is not None:
+        conditions.append(ds.field('event_id').isin([int(v) for v in event_ids]))
+    if ap_config_versions is not None:
+        conditions.append(ds.field('ap_config_version').isin([str(v) for v in ap_config_versions]))
+    if lv_ids is not None:
+        conditions.append(ds.field('lv_id').isin([int(v) for v in lv_ids]))
+    if level_names is not None:
+        conditions.append(ds.field('level_name').isin([str(v) for v in level_names]))
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    table = dataset.to_table(columns=columns, filter=expression)
+    df = table.to_pandas()
+
+    sort_keys = [col for col in ['event_id', 'ap_config_version', 'lv_id'] if col in df.columns]
+    if sort_keys:
+        df = df.sort_values(sort_keys, kind='stable').reset_index(drop=True)
+
+    return df
@@ -0,0 +1,212 @@
+"""
+上传文件的后台预解析
+
+文件上传后立即在独立的子进程中解析（openpyxl解析为纯Python，需要多进程才能并行），
+原始数据和配置文件同时解析。每个会话按文件标识记录任务，每种文件最多一个解析进程；
+文件被替换或移除时终止旧任务的进程，不再占用CPU，也不会排在其他会话的任务前面。
+"""
+import io
+import multiprocessing as mp
+import threading
+import time
+from concurrent.futures import BrokenExecutor, Future, InvalidStateError
+from typing import Dict, Optional, Tuple
+
+from utils.file_utils import read_raw_file, read_conf_file
+from utils.metrics import PARSE_SECONDS, PARSE_BYTES, byte_size_bucket
+
+INGEST_KINDS = ('raw', 'conf')
+
+
+def _parse_raw(data: bytes):
+    start = time.perf_counter()
+    df_raw = read_raw_file(io.BytesIO(data))
+    return df_raw, time.perf_counter() - start
+
+
+def _parse_conf(data: bytes):
+    start = time.perf_counter()
+    frames = read_conf_file(io.BytesIO(data))
+    return frames, time.perf_counter() - start
+
+
+_PARSERS = {'raw': _parse_raw, 'conf': _parse_conf}
+
+
+def _run_parser(kind: str, data: bytes, conn):
+    """
+    子进程入口：解析结果或异常通过管道发回
+    """
+    try:
+        conn.send((True, _PARSERS[kind](data)))
+    except Exception as e:
+        conn.send((False, e))
+    finally:
+        conn.close()
+
+
+def _mp_context():
+    # Streamlit为多线程进程，使用forkserver避免fork带锁
+    if 'forkserver' not in mp.get_all_start_methods():
+        return mp.get_context('spawn')
+    # forkserver预先导入解析模块，解析进程无需各自重新导入pandas/openpyxl
+    # （forkserver已启动时设置不生效，仅影响启动速度）
+    mp.set_forkserver_preload(['utils.ingest', 'openpyxl'])
+    return mp.get_context('forkserver')
+
+
+class ParseFuture(Future):
+    """
+    在独立进程中运行的解析任务
+
+    任务始终保持未开始状态直到结果返回，因此运行中也能取消；取消时终止解析进程。
+    进程异常退出（如被OOM终止）时以BrokenExecutor结束。
+    """
+
+    def __init__(self, process):
+        super().__init__()
+        self._process = process
+
+    def cancel(self) -> bool:
+        cancelled = super().cancel()
+        if cancelled and self._process.is_alive():
+            self._process.terminate()
+        return cancelled
+
+
+def _wait_result(future: ParseFuture, process, conn):
+    """
+    后台线程：等待子进程返回结果并完成future
+    """
+    try:
+        ok, payload = conn.recv()
+    except (EOFError, OSError):
+        ok, payload = False, None
+    finally:
+        conn.close()
+        process.join()
+
+    if not ok and payload is None:
+        payload = BrokenExecutor(f"解析进程异常退出（exitcode={process.exitcode}）")
+    try:
+        if ok:
+            future.set_result(payload)
+        else:
+            future.set_exception(payload)
+    except InvalidStateError:
+        # 已被取消
+        pass
+
+
+def _record_parse(n_bytes: int):
+    """
+    解析成功时记录解析指标的完成回调
+    """
+    def record(done: Future):
+        if not done.cancelled() and done.exception() is None:
+            PARSE_SECONDS.observe(done.result()[1], size_bucket=byte_size_bucket(n_bytes))
+            PARSE_BYTES.inc(n_bytes)
+    return record
+
+
+def start_parse(kind: str, data: bytes) -> ParseFuture:
+    """
+    启动解析进程，返回可终止的future
+    """
+    ctx = _mp_context()
+    recv_conn, send_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_run_parser, args=(kind, data, send_conn), daemon=True)
+    process.start()
+    send_conn.close()
+
+    future = ParseFuture(process)
+    future.add_done_callback(_record_parse(len(data)))
+    threading.Thread(target=_wait_result, args=(future, process, recv_conn), daemon=True).start()
+    return future
+
+
+def submit_ingest(jobs: Dict[str, Tuple[str, Future]],
+                  kind: str,
+                  file_key: str,
+                  uploaded_file) -> Future:
+    """
+    提交文件解析任务，同一文件只提交一次（之前的解析进程异常退出时重新提交），
+    替换文件时终止旧任务的进程
+
+    jobs: 会话内的任务表 kind -> (文件标识, future)，会被原地更新
+    无法启动子进程时抛出OSError，由调用方改为在当前进程解析
+    """
+    current = jobs.get(kind)
+    if current is not None:
+        future = current[1]
+        broken = future.done() and not future.cancelled() and isinstance(future.exception(), BrokenExecutor)
+        if current[0] == file_key and not broken:
+            return future
+        future.cancel()
+        del jobs[kind]
+
+    future = start_parse(kind, uploaded_file.getvalue())
+    jobs[kind] = (file_key, future)
+    return future
+
+
+def run_ingest_now(jobs: Dict[str, Tuple[str, Future]],
+                   kind: str,
+                   file_key: str,
+                   uploaded_file) -> Future:
+    """
+    在当前进程中解析（无法启动子进程时使用），结果以已完成的future记录在jobs中
+    """
+    data = uploaded_file.getvalue()
+    future = Future()
+    future.add_done_callback(_record_parse(len(data)))
+    try:
+        future.set_result(_PARSERS[kind](data))
+    except Exception as e:
+        future.set_exception(e)
+    jobs[kind] = (file_key, future)
+    return future
+
+
+def discard_ingest(jobs: Dict[str, Tuple[str, Future]], kind: str):
+    """
+    文件被移除时取消对应任务（终止解析进程）
+    """
+    current = jobs.pop(kind, None)
+    if current is not None:
+        current[1].cancel()
+
+
+def ingest_status(jobs: Dict[str, Tuple[str, Future]], kind: str) -> Optional[str]:
+    """
+    任务状态: None（未提交）、'running'、'done'、'failed'
+    """
+    current = jobs.get(kind)
+    if current is None:
+        return None
+    future = current[1]
+    if not future.done():
+        return 'running'
+    return 'failed' if future.cancelled() or future.exception() is not None else 'done'
+
+
+def ingest_running(jobs: Dict[str, Tuple[str, Future]]) -> bool:
+    """
+    是否有尚未完成的解析任务
+    """
+    return any(ingest_status(jobs, kind) == 'running' for kind in INGEST_KINDS)
+
+
+def ingest_ready(jobs: Dict[str, Tuple[str, Future]], kind: str) -> bool:
+    """
+    任务已提交且已完成（成功或失败）
+    """
+    return kind in jobs and jobs[kind][1].done()
+
+
+def ingest_result(jobs: Dict[str, Tuple[str, Future]], kind: str, timeout: Optional[float] = None):
+    """
+    等待并返回解析结果（raw为df_raw，conf为(df_level_conf, df_level_group, df_fuuu_rules)），
+    解析失败时抛出原异常
+    """
+    return jobs[kind][1].result(timeout=timeout)[0]
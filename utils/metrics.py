@@ -0,0 +1,230 @@
+"""
+进程内指标注册表（Prometheus文本格式导出）
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# 默认耗时分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Sequence[str], extra: str = '') -> str:
+    pairs = []
+    for name, value in zip(labelnames, labelvalues):
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """
+    单调递增计数器
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """
+    累积分桶直方图
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            items = sorted((key, ([*state[0]], state[1], state[2])) for key, state in self._values.items())
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(float(bound))}"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(name, lambda: Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(name, lambda: Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """
+        导出Prometheus文本格式
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, name: str, factory):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = factory()
+            return self._metrics[name]
+
+
+REGISTRY = MetricsRegistry()
+
+PARSE_SECONDS = REGISTRY.histogram(
+    'jewel_parse_seconds', '上传文件解析耗时', ['size_bucket'])
+PARSE_BYTES = REGISTRY.counter(
+    'jewel_parse_bytes_total', '已解析的上传文件字节数')
+PIPELINE_SECONDS = REGISTRY.histogram(
+    'jewel_pipeline_seconds', 'run_full_pipeline总耗时', ['engine', 'size_bucket'])
+PIPELINE_STAGE_SECONDS = REGISTRY.histogram(
+    'jewel_pipeline_stage_seconds', '流水线各阶段耗时', ['stage', 'size_bucket'])
+PIPELINE_FAILURES = REGISTRY.counter(
+    'jewel_pipeline_failures_total', '流水线失败次数（按失败阶段）', ['stage'])
+ROWS_PROCESSED = REGISTRY.counter(
+    'jewel_rows_processed_total', '流水线处理的原始数据行数', ['engine'])
+EXPORT_SECONDS = REGISTRY.histogram(
+    'jewel_export_seconds', '结果文件生成耗时', ['format'])
+VALIDATION_FAILURES = REGISTRY.counter(
+    'jewel_validation_failures_total', '数据验证失败次数', ['frame'])
+CACHE_REQUESTS = REGISTRY.counter(
+    'jewel_cache_requests_total', '缓存命中/未命中次数', ['cache', 'result'])
+
+
+def size_bucket(n_rows: int) -> str:
+    """
+    按行数划分的输入规模标签
+    """
+    if n_rows < 10_000:
+        return '<10k'
+    if n_rows < 100_000:
+        return '10k-100k'
+    if n_rows < 1_000_000:
+        return '100k-1M'
+    return '>=1M'
+
+
+def byte_size_bucket(n_bytes: int) -> str:
+    """
+    按字节数划分的文件规模标签
+    """
+    mb = n_bytes / (1024 * 1024)
+    if mb < 1:
+        return '<1MB'
+    if mb < 10:
+        return '1-10MB'
+    if mb < 100:
+        return '10-100MB'
+    return '>=100MB'
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+_exporters: Dict[str, threading.Thread] = {}
+_exporters_lock = threading.Lock()
+
+
+def write_metrics_file(path: str, registry: Optional[MetricsRegistry] = None):
+    """
+    将指标写入文件（先写临时文件再原子替换，适合node_exporter textfile采集）
+    """
+    registry = registry or REGISTRY
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(registry.render())
+    os.replace(tmp_path, path)
+
+
+def start_file_exporter(path: str, interval: float = 15.0) -> threading.Thread:
+    """
+    启动后台线程定期写出指标文件，同一路径只启动一次
+    """
+    with _exporters_lock:
+        thread = _exporters.get(path)
+        if thread is not None and thread.is_alive():
+            return thread
+
+        def loop():
+            while True:
+                try:
+                    write_metrics_file(path)
+                except OSError:
+                    pass
+                time.sleep(interval)
+
+        thread = threading.Thread(target=loop, name='metrics-exporter', daemon=True)
+        thread.start()
+        _exporters[path] = thread
+        return thread
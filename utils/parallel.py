@@ -0,0 +1,205 @@
+"""
+共享内存多进程执行
+
+处理后数据的数值列只放入共享内存一次，子进程按lv_id或level_name分区直接读写，
+不序列化整张表。每个分区内复用data_processing中的串行实现，分组内行顺序不变，
+因此结果与串行路径完全一致。
+"""
+import multiprocessing as mp
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+from functools import partial
+from multiprocessing import shared_memory
+import threading
+import pandas as pd
+import numpy as np
+from typing import Dict, List, Tuple
+
+from utils.rule_tables import RuleTable
+from utils.data_processing import (
+    add_zscore,
+    add_evaluation,
+    level_evaluations,
+    level_rec_difficulty
+)
+
+# 放入共享内存的列：输入列由主进程写入，输出列由子进程写入
+_INPUT_COLUMNS = {'lv_id': np.float64, 'event_id': np.float64, 'actual_rev': np.float64, 'level_code': np.int64}
+_OUTPUT_COLUMNS = {'z-score': np.float64, 'fuuu': np.float64, 'evaluation': np.float64}
+
+_POOLS: Dict[int, ProcessPoolExecutor] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _get_pool(n_workers: int) -> ProcessPoolExecutor:
+    """
+    按进程数复用进程池（Streamlit为多线程进程，使用forkserver避免fork带锁）
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(n_workers)
+        if pool is None:
+            method = 'forkserver' if 'forkserver' in mp.get_all_start_methods() else 'spawn'
+            pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=mp.get_context(method))
+            _POOLS[n_workers] = pool
+        return pool
+
+
+def _discard_pool(n_workers: int, pool: ProcessPoolExecutor):
+    """
+    移除已损坏的进程池（如子进程被OOM终止），下次调用_get_pool时重建
+    """
+    with _POOLS_LOCK:
+        if _POOLS.get(n_workers) is pool:
+            del _POOLS[n_workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _layout(n_rows: int) -> Dict[str, Tuple[int, str]]:
+    """
+    共享内存块内各列的(偏移, dtype)
+    """
+    layout, offset = {}, 0
+    for name, dtype in {**_INPUT_COLUMNS, **_OUTPUT_COLUMNS}.items():
+        layout[name] = (offset, np.dtype(dtype).str)
+        offset += n_rows * np.dtype(dtype).itemsize
+    return layout
+
+
+def _views(shm: shared_memory.SharedMemory, layout: Dict[str, Tuple[int, str]], n_rows: int) -> Dict[str, np.ndarray]:
+    return {
+        name: np.ndarray((n_rows,), dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        for name, (offset, dtype) in layout.items()
+    }
+
+
+def _partition(keys: np.ndarray, n_parts: int) -> List[np.ndarray]:
+    """
+    按行数均衡地把键分到n_parts个分区（大分区优先分给当前最空的分区）
+    """
+    values, counts = np.unique(keys, return_counts=True)
+    loads = np.zeros(n_parts, dtype=np.int64)
+    assignment = np.empty(len(values), dtype=np.int64)
+    for i in np.argsort(-counts, kind='stable'):
+        target = int(np.argmin(loads))
+        assignment[i] = target
+        loads[target] += counts[i]
+    return [values[assignment == p] for p in range(n_parts) if (assignment == p).any()]
+
+
+def _level_stage_worker(shm_name: str, layout: Dict, n_rows: int, lv_ids: np.ndarray,
+                        zscore_threshold: float, rule_table: RuleTable):
+    """
+    子进程：计算一组lv_id的z-score、fuuu、evaluation并写回共享内存
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        arrays = _views(shm, layout, n_rows)
+        idx = np.flatnonzero(np.isin(arrays['lv_id'], lv_ids))
+
+        part = pd.DataFrame({
+            'lv_id': arrays['lv_id'][idx],
+            'event_id': arrays['event_id'][idx],
+            'actual_rev': arrays['actual_rev'][idx]
+        })
+        part = add_zscore(part)
+        part['fuuu'] = rule_table.lookup(part['lv_id'].to_numpy(), part['event_id'].to_numpy())
+        part = add_evaluation(part, zscore_threshold)
+
+        arrays['z-score'][idx] = part['z-score'].to_numpy(dtype=float)
+        arrays['fuuu'][idx] = part['fuuu'].to_numpy(dtype=float)
+        arrays['evaluation'][idx] = part['evaluation'].to_numpy(dtype=float, na_value=np.nan)
+        del arrays
+    finally:
+        shm.close()
+
+
+def _aggregate_worker(shm_name: str, layout: Dict, n_rows: int, codes: np.ndarray):
+    """
+    子进程：计算一组level_name（编码）的evaluation列表和rec_difficulty
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        arrays = _views(shm, layout, n_rows)
+        idx = np.flatnonzero(np.isin(arrays['level_code'], codes))
+
+        part = pd.DataFrame({
+            'level_name': arrays['level_code'][idx],
+            'evaluation': pd.Series(arrays['evaluation'][idx]).astype('Int64'),
+            'fuuu': arrays['fuuu'][idx]
+        })
+        del arrays
+        return level_evaluations(part).to_dict(), level_rec_difficulty(part).to_dict()
+    finally:
+        shm.close()
+
+
+def run_parallel_level_stages(df: pd.DataFrame,
+                              n_workers: int,
+                              zscore_threshold: float,
+                              rule_table: RuleTable) -> Tuple[pd.DataFrame, pd.Series, pd.Series]:
+    """
+    多进程执行z-score、fuuu、evaluation以及level_conf聚合
+
+    df需已包含actual_rev和level_name列。
+    返回: (添加了z-score、fuuu、evaluation的df, level_evaluations结果, level_rec_difficulty结果)
+    """
+    df = df.reset_index(drop=True)
+    n_rows = len(df)
+    codes, level_names = pd.factorize(df['level_name'])
+
+    layout = _layout(n_rows)
+    size = sum(n_rows * np.dtype(dtype).itemsize for dtype in {**_INPUT_COLUMNS, **_OUTPUT_COLUMNS}.values())
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        arrays = _views(shm, layout, n_rows)
+        arrays['lv_id'][:] = pd.to_numeric(df['lv_id'], errors='coerce').to_numpy(dtype=float)
+        arrays['event_id'][:] = pd.to_numeric(df['event_id'], errors='coerce').to_numpy(dtype=float)
+        arrays['actual_rev'][:] = df['actual_rev'].to_numpy(dtype=float)
+        arrays['level_code'][:] = codes
+        # lv_id为空的行不属于任何分区，与串行路径一样保持为空
+        for name in _OUTPUT_COLUMNS:
+            arrays[name][:] = np.nan
+
+        def run_partitions(pool: ProcessPoolExecutor):
+            # 按lv_id分区：z-score、fuuu、evaluation
+            list(pool.map(
+                partial(_level_stage_worker, shm.name, layout, n_rows,
+                        zscore_threshold=zscore_threshold, rule_table=rule_table),
+                _partition(arrays['lv_id'][~np.isnan(arrays['lv_id'])], n_workers)
+            ))
+
+            # 按level_name分区：level_conf聚合
+            evaluations, rec_difficulty = {}, {}
+            for part_evaluations, part_rec in pool.map(
+                partial(_aggregate_worker, shm.name, layout, n_rows),
+                _partition(codes[codes >= 0], n_workers)
+            ):
+                evaluations.update(part_evaluations)
+                rec_difficulty.update(part_rec)
+            return evaluations, rec_difficulty
+
+        # 进程池损坏时重建并重试一次（输出列每次都被完整重写）
+        pool = _get_pool(n_workers)
+        try:
+            evaluations, rec_difficulty = run_partitions(pool)
+        except BrokenExecutor:
+            _discard_pool(n_workers, pool)
+            pool = _get_pool(n_workers)
+            try:
+                evaluations, rec_difficulty = run_partitions(pool)
+            except BrokenExecutor:
+                _discard_pool(n_workers, pool)
+                raise
+
+        df['z-score'] = arrays['z-score'].copy()
+        fuuu = pd.Series(arrays['fuuu'].copy())
+        df['fuuu'] = fuuu.astype('int64') if fuuu.notna().all() else fuuu
+        df['evaluation'] = pd.Series(arrays['evaluation'].copy()).astype('Int64')
+    finally:
+        # 先释放对共享内存的视图，否则close会因仍有导出的缓冲区而失败
+        arrays = None
+        shm.close()
+        shm.unlink()
+
+    evaluations = pd.Series({level_names[code]: value for code, value in evaluations.items()}, dtype=object)
+    rec_difficulty = pd.Series({level_names[code]: value for code, value in rec_difficulty.items()}, dtype=object)
+    return df, evaluations, rec_difficulty
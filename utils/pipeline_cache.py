@@ -0,0 +1,196 @@
+"""
+流水线阶段的依赖声明与结果缓存
+
+每个阶段声明输入（源数据或上游阶段）、读取的源数据列和参数。阶段指纹由
+阶段名、参数、所读源数据列的内容哈希以及上游阶段指纹组成（Merkle式），
+任一依赖变化都会使该阶段及其下游的指纹变化，未变化的阶段直接复用缓存结果。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+import pandas as pd
+import numpy as np
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from utils.metrics import record_cache
+
+# 缓存结果的默认内存上限（字节）
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+
+class Stage:
+    """
+    流水线阶段
+
+    func: 以inputs对应的值为位置参数、params中的参数为关键字参数调用
+    inputs: 源数据名（如'df_raw'）或上游阶段名，第一个为主输入
+    columns: 源数据名 -> 该阶段读取的列，未声明的源数据视为读取全部列
+    params: 影响结果的参数名
+    cacheable: 是否缓存结果。下游阶段的缓存总是与其同时失效、不可能单独命中的阶段
+               应设为False，避免缓存中多存一份整表
+    """
+
+    def __init__(self, name: str, func: Callable, inputs: Sequence[str],
+                 columns: Optional[Dict[str, Sequence[str]]] = None,
+                 params: Sequence[str] = (),
+                 cacheable: bool = True):
+        self.name = name
+        self.func = func
+        self.inputs = tuple(inputs)
+        self.columns = {source: tuple(cols) for source, cols in (columns or {}).items()}
+        self.params = tuple(params)
+        self.cacheable = cacheable
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, inputs={self.inputs})"
+
+
+def fingerprint_frame(df: pd.DataFrame, columns: Optional[Sequence[str]] = None) -> str:
+    """
+    DataFrame指定列（默认全部列）的内容哈希，包含列名、dtype和索引
+    """
+    columns = list(df.columns) if columns is None else [col for col in columns if col in df.columns]
+    h = hashlib.sha256()
+    h.update(repr([(col, str(df[col].dtype)) for col in columns]).encode('utf-8'))
+    h.update(pd.util.hash_pandas_object(df[columns], index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def fingerprint_value(value: Any) -> str:
+    """
+    参数的指纹：对象提供fingerprint()时使用其结果，否则使用repr
+    """
+    if hasattr(value, 'fingerprint'):
+        return value.fingerprint()
+    return repr(value)
+
+
+def _estimate_bytes(value: Any) -> int:
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        # deep=True：object列的字符串按实际大小计算
+        usage = value.memory_usage(index=True, deep=True)
+        return int(usage.sum() if isinstance(usage, pd.Series) else usage)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(_estimate_bytes(item) for item in value)
+    return 0
+
+
+class StageCache:
+    """
+    按阶段指纹缓存阶段结果（LRU，按内存上限淘汰）
+
+    缓存的结果会被后续运行直接复用，调用方不应原地修改。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[Any, int]]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            self._entries.move_to_end(key)
+            return True, entry[0]
+
+    def put(self, key: str, value: Any):
+        size = _estimate_bytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def stage_fingerprints(stages: Sequence[Stage],
+                       sources: Dict[str, pd.DataFrame],
+                       params: Dict[str, Any]) -> Dict[str, str]:
+    """
+    按声明顺序计算每个阶段的指纹（上游阶段须排在前面）
+    """
+    source_hashes: Dict[Tuple[str, Optional[Tuple[str, ...]]], str] = {}
+
+    def source_hash(source: str, columns: Optional[Tuple[str, ...]]) -> str:
+        key = (source, columns)
+        if key not in source_hashes:
+            source_hashes[key] = fingerprint_frame(sources[source], columns)
+        return source_hashes[key]
+
+    fingerprints: Dict[str, str] = {}
+    for stage in stages:
+        h = hashlib.sha256(stage.name.encode('utf-8'))
+        for name in stage.inputs:
+            if name in sources:
+                token = source_hash(name, stage.columns.get(name))
+            else:
+                token = fingerprints[name]
+            h.update(f'{name}={token};'.encode('utf-8'))
+        for name in stage.params:
+            h.update(f'{name}={fingerprint_value(params[name])};'.encode('utf-8'))
+        fingerprints[stage.name] = h.hexdigest()
+    return fingerprints
+
+
+def run_stages(stages: Sequence[Stage],
+               targets: Sequence[str],
+               sources: Dict[str, pd.DataFrame],
+               params: Dict[str, Any],
+               cache: Optional[StageCache] = None,
+               run_stage: Optional[Callable[[Stage, Tuple], Any]] = None) -> Dict[str, Any]:
+    """
+    计算targets阶段的结果，只运行指纹未命中缓存的阶段及其所需的上游阶段
+
+    run_stage: 实际执行阶段的回调 run_stage(stage, 输入值)，默认直接调用stage.func
+    返回: {阶段名: 结果}（包含本次用到的所有阶段）
+    """
+    by_name = {stage.name: stage for stage in stages}
+    fingerprints = stage_fingerprints(stages, sources, params) if cache is not None else {}
+    results: Dict[str, Any] = {}
+
+    def execute(stage: Stage, values: Tuple):
+        if run_stage is not None:
+            return run_stage(stage, values)
+        return stage.func(*values, **{name: params[name] for name in stage.params})
+
+    def resolve(name: str):
+        if name in sources:
+            return sources[name]
+        if name in results:
+            return results[name]
+
+        stage = by_name[name]
+        use_cache = cache is not None and stage.cacheable
+        if use_cache:
+            hit, value = cache.get(fingerprints[name])
+            record_cache('pipeline_stage', hit)
+            if hit:
+                results[name] = value
+                return value
+
+        value = execute(stage, tuple(resolve(input_name) for input_name in stage.inputs))
+        if use_cache:
+            cache.put(fingerprints[name], value)
+        results[name] = value
+        return value
+
+    for target in targets:
+        resolve(target)
+    return results
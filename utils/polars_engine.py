@@ -0,0 +1,229 @@
+"""
+基于Polars的列式查询引擎
+
+与data_processing中的pandas实现逐阶段对应，输出列与pandas引擎一致
+（浮点统计量可能存在舍入级别的差异）。
+"""
+import pandas as pd
+import numpy as np
+import polars as pl
+from typing import Optional, Tuple
+
+from utils.rule_tables import RuleTable
+from utils.data_processing import (
+    FUUU_EVA,
+    ZSCORE_THRESHOLD,
+    DEFAULT_RULE_TABLE,
+    build_level_index,
+    process_attribute,
+    adjust_column_order
+)
+
+# 新增的结果列
+RESULT_COLUMNS = ['level_name', 'churn_rate', 'rev', 'actual_rev', 'z-score', 'fuuu', 'evaluation']
+
+
+def _fuuu_table(rule_table: RuleTable) -> pl.LazyFrame:
+    """
+    (曲线下标, lv_id)到fuuu值的长表
+    """
+    n_curves, width = rule_table.curves.shape
+    values = rule_table.curves.ravel()
+    valid = ~np.isnan(values)
+    return pl.LazyFrame({
+        '_curve': np.repeat(np.arange(n_curves, dtype=np.int64), width)[valid],
+        'lv_id': np.tile(np.arange(1, width + 1, dtype=np.int64), n_curves)[valid],
+        'fuuu': values[valid].astype(np.int64)
+    })
+
+
+def _curve_index_expr(rule_table: RuleTable) -> pl.Expr:
+    """
+    与RuleTable.curve_index一致的曲线选择：event_id为空时使用最后一条规则
+    """
+    event_id = pl.col('event_id')
+    last = len(rule_table.starts) - 1
+    expr = pl.when(event_id.is_null()).then(last)
+    for i in range(last, -1, -1):
+        expr = expr.when(event_id >= rule_table.starts[i]).then(i)
+    return expr.otherwise(None).cast(pl.Int64)
+
+
+def _fuuu_eva_table() -> pl.LazyFrame:
+    """
+    fuuu到FUUU_EVA的查找表
+    """
+    return pl.LazyFrame({
+        '_fuuu_key': pl.Series(list(FUUU_EVA.keys()), dtype=pl.Int64),
+        '_fuuu_eva': pl.Series(list(FUUU_EVA.values()), dtype=pl.Int64)
+    })
+
+
+def _lv_group_expr() -> pl.Expr:
+    """
+    与pandas版本的pd.cut(bins=[0, 20, 40, 60, 120])一致的分组
+    """
+    lv_id = pl.col('lv_id')
+    return (pl.when((lv_id > 0) & (lv_id <= 20)).then(0)
+            .when((lv_id > 20) & (lv_id <= 40)).then(1)
+            .when((lv_id > 40) & (lv_id <= 60)).then(2)
+            .when((lv_id > 60) & (lv_id <= 120)).then(3)
+            .otherwise(None))
+
+
+def _group_mean(column: str) -> pl.Expr:
+    """
+    按lv分组求均值，不在任何分组内的行为空
+    """
+    return (pl.when(pl.col('_lv_group').is_not_null())
+            .then(pl.col(column).mean().over('_lv_group'))
+            .otherwise(None))
+
+
+def build_processed_query(raw: pl.LazyFrame,
+                          level_index: pl.LazyFrame,
+                          zscore_threshold: float = ZSCORE_THRESHOLD,
+                          rule_table: RuleTable = DEFAULT_RULE_TABLE) -> pl.LazyFrame:
+    """
+    构建主数据的惰性查询：level_name、churn_rate、rev、actual_rev、z-score、fuuu、evaluation
+    """
+    # level_name join
+    lf = (raw
+          .with_columns(pl.col('event_id').cast(pl.Utf8).alias('event_key'))
+          .join(level_index, on=['event_key', 'ap_key', 'lv_id'], how='left')
+          .drop(['event_key', 'ap_key']))
+
+    # churn_rate与rev
+    lf = lf.with_columns(
+        pl.col('total_churn_rate').fill_null(pl.col('in_level_churn_rate')).alias('churn_rate'),
+        (pl.col('avg_start_times') * 10 + pl.col('rv_efficiency') * 15).alias('rev'),
+        _lv_group_expr().alias('_lv_group')
+    )
+
+    # 分组actual_rev
+    lf = lf.with_columns(
+        _group_mean('rev').alias('_group_avg_rev'),
+        _group_mean('churn_rate').alias('_group_avg_churn_rate')
+    ).with_columns(
+        pl.when(pl.col('_group_avg_churn_rate') == 0)
+        .then(pl.col('rev'))
+        .otherwise(pl.col('rev') - pl.col('churn_rate')
+                   * (pl.col('_group_avg_rev') / pl.col('_group_avg_churn_rate')))
+        .fill_nan(None)
+        .alias('actual_rev')
+    ).with_columns(
+        pl.when((pl.col('actual_rev') > 200) | (pl.col('actual_rev') < -200))
+        .then(None)
+        .otherwise(pl.col('actual_rev'))
+        .alias('actual_rev')
+    )
+
+    # 每个lv_id的z-score（统计量只用event_id >= 60的数据）
+    group_stats = (lf
+                   .filter(pl.col('event_id') >= 60)
+                   .group_by('lv_id')
+                   .agg(pl.col('actual_rev').mean().alias('_mean_actual_rev'),
+                        pl.col('actual_rev').std().alias('_std_actual_rev')))
+
+    lf = lf.join(group_stats, on='lv_id', how='left').with_columns(
+        pl.when(pl.col('_std_actual_rev') == 0)
+        .then(0.0)
+        .otherwise((pl.col('actual_rev') - pl.col('_mean_actual_rev')) / pl.col('_std_actual_rev'))
+        .alias('z-score')
+    )
+
+    # fuuu与evaluation
+    lf = (lf
+          .with_columns(_curve_index_expr(rule_table).alias('_curve'))
+          .join(_fuuu_table(rule_table), on=['_curve', 'lv_id'], how='left')
+          .join(_fuuu_eva_table(), left_on='fuuu', right_on='_fuuu_key', how='left')
+          .with_columns(
+              pl.when(pl.col('event_id') < 60)
+              .then(None)
+              .when(pl.col('z-score') > zscore_threshold)
+              .then(pl.col('_fuuu_eva'))
+              .when(pl.col('z-score') < -zscore_threshold)
+              .then(-pl.col('_fuuu_eva'))
+              .otherwise(None)
+              .cast(pl.Int64)
+              .alias('evaluation')))
+
+    return lf.select(['_row'] + RESULT_COLUMNS).sort('_row')
+
+
+def build_evaluation_query(processed: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    每个level_name的evaluation列表（按原数据行顺序拼接）
+    """
+    return (processed
+            .filter(pl.col('level_name').is_not_null() & pl.col('evaluation').is_not_null())
+            .sort('_row')
+            .group_by('level_name', maintain_order=True)
+            .agg(pl.col('evaluation').cast(pl.Utf8).str.join(',').alias('evaluation')))
+
+
+def build_rec_difficulty_query(processed: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    每个level_name的rec_difficulty（evaluation为空或>=0的行的fuuu映射值，去重排序）
+    """
+    return (processed
+            .filter(pl.col('level_name').is_not_null()
+                    & pl.col('fuuu').is_not_null()
+                    & (pl.col('evaluation').is_null() | (pl.col('evaluation') >= 0)))
+            .join(_fuuu_eva_table(), left_on='fuuu', right_on='_fuuu_key', how='inner')
+            .select(pl.col('level_name'), pl.col('_fuuu_eva').cast(pl.Utf8).alias('rec'))
+            .unique()
+            .group_by('level_name')
+            .agg(pl.col('rec').sort().str.join(',').alias('rec_difficulty')))
+
+
+def run_polars_pipeline(df_raw: pd.DataFrame,
+                        df_level_conf: pd.DataFrame,
+                        df_level_group: pd.DataFrame,
+                        zscore_threshold: float = ZSCORE_THRESHOLD,
+                        rule_table: Optional[RuleTable] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    用Polars惰性查询运行流水线，返回(df, df_level_conf)
+    """
+    # 只把参与计算的列交给Polars，其余列原样保留
+    raw = pl.from_pandas(pd.DataFrame({
+        'event_id': df_raw['event_id'].to_numpy(),
+        'ap_key': df_raw['ap_config_version'].astype(str).to_numpy(),
+        'lv_id': df_raw['lv_id'].astype(int).to_numpy(dtype='int64'),
+        'total_churn_rate': pd.to_numeric(df_raw['total_churn_rate'], errors='coerce').to_numpy(),
+        'in_level_churn_rate': pd.to_numeric(df_raw['in_level_churn_rate'], errors='coerce').to_numpy(),
+        'avg_start_times': pd.to_numeric(df_raw['avg_start_times'], errors='coerce').to_numpy(),
+        'rv_efficiency': pd.to_numeric(df_raw['rv_efficiency'], errors='coerce').to_numpy()
+    })).with_row_index('_row').lazy()
+
+    level_index = pl.from_pandas(build_level_index(df_level_group)).lazy()
+
+    processed = build_processed_query(raw, level_index, zscore_threshold, rule_table or DEFAULT_RULE_TABLE)
+    result, evaluations, rec_difficulty = pl.collect_all([
+        processed,
+        build_evaluation_query(processed),
+        build_rec_difficulty_query(processed)
+    ])
+
+    # 组装主数据
+    df = df_raw.copy().reset_index(drop=True)
+    df['lv_id'] = df['lv_id'].astype(int)
+    for column in RESULT_COLUMNS:
+        df[column] = result[column].to_pandas().to_numpy()
+
+    df['evaluation'] = pd.Series(df['evaluation'], dtype='float').astype('Int64')
+    if df['fuuu'].notna().all():
+        df['fuuu'] = df['fuuu'].astype('int64')
+
+    # 组装配置数据
+    level_evaluations = pd.Series(evaluations['evaluation'].to_list(),
+                                  index=evaluations['level_name'].to_list())
+    level_rec = pd.Series(rec_difficulty['rec_difficulty'].to_list(),
+                          index=rec_difficulty['level_name'].to_list())
+
+    df_level_conf = process_attribute(df_level_conf)
+    df_level_conf['evaluation'] = df_level_conf['level_name'].map(level_evaluations).fillna('')
+    df_level_conf['rec_difficulty'] = df_level_conf['level_name'].map(level_rec).fillna('')
+    df_level_conf = adjust_column_order(df_level_conf)
+
+    return df, df_level_conf
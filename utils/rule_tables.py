@@ -0,0 +1,119 @@
+"""
+fuuu规则表
+
+规则表把event_id区间映射到fuuu曲线，编译为排序后的区间起点数组和
+二维曲线数组（曲线 × lv_id），每行通过一次searchsorted选出曲线。
+配置文件中可选的fuuu_rules sheet格式:
+
+    event_id_start | fuuu_list              | version（可选）
+    0              | -6,-5,-1,-3,1,...      | 2024-06
+    86             | -1,-5,-1,-3,1,...      |
+
+每条规则从event_id_start开始生效，直到下一条规则的起点；event_id为空的行使用最后一条规则。
+"""
+import hashlib
+import threading
+import pandas as pd
+import numpy as np
+from typing import Dict, List, Sequence
+
+RULE_SHEET_NAME = 'fuuu_rules'
+
+
+class RuleTable:
+    """
+    编译后的fuuu规则表
+    """
+
+    def __init__(self, starts: Sequence[float], curves: Sequence[Sequence[int]], version: str):
+        starts = np.asarray(starts, dtype=float)
+        order = np.argsort(starts, kind='stable')
+
+        if len(starts) == 0:
+            raise ValueError("fuuu规则表不能为空")
+        if len(np.unique(starts)) != len(starts):
+            raise ValueError("fuuu规则表的event_id_start不能重复")
+
+        width = max(len(curve) for curve in curves)
+        matrix = np.full((len(curves), width), np.nan)
+        for i, curve in enumerate(curves):
+            matrix[i, :len(curve)] = curve
+
+        self.starts = starts[order]
+        self.curves = matrix[order]
+        self.version = version
+
+    def curve_index(self, event_id: np.ndarray) -> np.ndarray:
+        """
+        每行使用的曲线下标，早于第一条规则的行为-1（NaN排在最后，使用最后一条规则）
+        """
+        return np.searchsorted(self.starts, event_id, side='right') - 1
+
+    def lookup(self, lv_id: np.ndarray, event_id: np.ndarray) -> np.ndarray:
+        """
+        按(event_id, lv_id)查fuuu值，无对应规则或lv_id越界时为NaN
+        """
+        curve = self.curve_index(np.asarray(event_id, dtype=float))
+        column = np.trunc(np.asarray(lv_id, dtype=float)) - 1
+        valid = (curve >= 0) & (column >= 0) & (column < self.curves.shape[1])
+
+        result = np.full(len(curve), np.nan)
+        result[valid] = self.curves[curve[valid], column[valid].astype(np.int64)]
+        return result
+
+    def fingerprint(self) -> str:
+        """
+        规则内容的哈希（不含version），用于流水线缓存
+        """
+        h = hashlib.sha256(self.starts.tobytes())
+        h.update(self.curves.tobytes())
+        return h.hexdigest()
+
+    def __repr__(self):
+        return f"RuleTable(version={self.version!r}, curves={len(self.starts)})"
+
+
+_REGISTRY: Dict[str, RuleTable] = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _parse_curve(value) -> List[int]:
+    if pd.isna(value):
+        raise ValueError("fuuu_list不能为空")
+    try:
+        return [int(item.strip()) for item in str(value).split(',') if item.strip()]
+    except ValueError:
+        raise ValueError(f"fuuu_list格式错误: {value}")
+
+
+def compile_rule_table(df_rules: pd.DataFrame) -> RuleTable:
+    """
+    编译fuuu_rules sheet，相同内容（含version）只编译一次
+    """
+    missing = [col for col in ('event_id_start', 'fuuu_list') if col not in df_rules.columns]
+    if missing:
+        raise ValueError(f"{RULE_SHEET_NAME}缺少列: {missing}")
+
+    df_rules = df_rules.dropna(subset=['event_id_start', 'fuuu_list'], how='all')
+    key_columns = [col for col in ('event_id_start', 'fuuu_list', 'version') if col in df_rules.columns]
+    fingerprint = hashlib.sha256(
+        df_rules[key_columns].astype(str).to_csv(index=False).encode('utf-8')
+    ).hexdigest()
+
+    with _REGISTRY_LOCK:
+        table = _REGISTRY.get(fingerprint)
+        if table is not None:
+            return table
+
+    starts = pd.to_numeric(df_rules['event_id_start'], errors='coerce')
+    if starts.isna().any():
+        raise ValueError(f"{RULE_SHEET_NAME}的event_id_start必须为数字")
+
+    version = f'sha-{fingerprint[:8]}'
+    if 'version' in df_rules.columns and df_rules['version'].notna().any():
+        version = str(df_rules['version'].dropna().iloc[0])
+
+    table = RuleTable(starts.to_numpy(), [_parse_curve(v) for v in df_rules['fuuu_list']], version)
+
+    with _REGISTRY_LOCK:
+        return _REGISTRY.setdefault(fingerprint, table)